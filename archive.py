@@ -0,0 +1,312 @@
+import gzip
+import os
+import time
+from datetime import datetime
+
+from bson import json_util
+from flask import has_app_context
+from pymongo.errors import BulkWriteError
+
+from extensions import caches
+from indexes import INDEXES
+
+# Hot/cold partitioning of the ledger. Recent rows stay in `transactions`; whole
+# months older than the hot window are moved into `transactions_YYYY_MM`, and
+# can later be offloaded from there into compressed NDJSON files.
+#
+# The archives document (_id 'transactions') records:
+#   cutoff     every row dated before it lives in an archive, never in the hot set
+#   months     {'YYYY-MM': {'storage': 'collection' | 'file', 'path', 'rows', 'types'}}
+#   inProgress {'month', 'phase': 'copy' | 'delete', 'lastDateTime', 'lastId'} while a month is moving
+# Date comparisons never match legacy string dates, so a cutoff would hide those
+# rows from every reader; archive() refuses to run until migrate-datetimes is done.
+STATE_ID = 'transactions'
+
+# Months kept in the hot collection, counting the current one
+HOT_MONTHS = 3
+# Rows copied or deleted per round trip; the job sleeps `pause` seconds between them
+ARCHIVE_BATCH_SIZE = 1000
+
+# Seconds a read may use the routing state from the archive_state cache
+CACHE_TTL = 5
+
+
+def month_bounds(month):
+    start = datetime.strptime(month, '%Y-%m')
+    end = start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+    return start, end
+
+
+def month_of(when):
+    return when.strftime('%Y-%m')
+
+
+def collection_name(month):
+    return 'transactions_' + month.replace('-', '_')
+
+
+def _load_state(db):
+    return db['archives'].find_one({'_id': STATE_ID}) or {'_id': STATE_ID, 'months': {}}
+
+
+def get_state(db, fresh=False):
+    # Outside the app (e.g. reconcile's worker processes) there is no cache to read through
+    if fresh or not has_app_context():
+        return _load_state(db)
+    return caches()['archive_state'].get(db.name, lambda: _load_state(db))
+
+
+def _save_state(db, fields):
+    db['archives'].update_one({'_id': STATE_ID}, fields, upsert=True)
+    if has_app_context():
+        caches()['archive_state'].invalidate(db.name)
+
+
+def hot_match(state, match):
+    # Rows below the cutoff may linger in the hot set while their month is being
+    # deleted; they are already served from the archive
+    if not state.get('cutoff'):
+        return match
+    clause = {'dateTime': {'$gte': state['cutoff']}}
+    return {'$and': [match, clause]} if match else clause
+
+
+def ledger_sources(db, start=None, end=None):
+    # Where rows dated in [start, end) live, newest first:
+    # ('hot', 'transactions', None), ('collection', name, month) or ('file', path, month)
+    state = get_state(db)
+    sources = []
+    if not (end and state.get('cutoff') and end <= state['cutoff']):
+        sources.append(('hot', 'transactions', None))
+    for month in sorted(state.get('months', {}), reverse=True):
+        month_start, month_end = month_bounds(month)
+        if (start and month_end <= start) or (end and month_start >= end):
+            continue
+        entry = state['months'][month]
+        if entry['storage'] == 'file':
+            sources.append(('file', entry['path'], month))
+        else:
+            sources.append(('collection', collection_name(month), month))
+    return sources
+
+
+def iter_page(db, match, limit, pipeline, start=None, end=None):
+    # Newest-first rows across the hot set and the archive collections, fetched
+    # lazily so a streamed page starts rendering after the first source answers.
+    # Months are disjoint and visited in date order, so the (dateTime, _id) keyset
+    # cursor in `match` carries over from one source to the next. File archives
+    # are skipped; they are only reachable through exports.
+    state = get_state(db)
+    remaining = limit
+    for kind, name, month in ledger_sources(db, start, end):
+        if kind == 'file':
+            continue
+        source_match = hot_match(state, match) if kind == 'hot' else match
+        for row in db[name].aggregate(pipeline(source_match, remaining)):
+            remaining -= 1
+            yield row
+        if remaining <= 0:
+            break
+
+
+_OPERATORS = {
+    '$gte': lambda value, operand: value >= operand,
+    '$gt': lambda value, operand: value > operand,
+    '$lt': lambda value, operand: value < operand,
+    '$lte': lambda value, operand: value <= operand,
+    '$ne': lambda value, operand: value != operand,
+}
+
+
+def _matches(row, match):
+    # Evaluates the subset of query operators build_transaction_match produces
+    for field, condition in match.items():
+        if field == '$and':
+            if not all(_matches(row, clause) for clause in condition):
+                return False
+        elif field == '$or':
+            if not any(_matches(row, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = row.get(field)
+            if value is None or not all(_OPERATORS[operator](value, operand)
+                                        for operator, operand in condition.items()):
+                return False
+        elif row.get(field) != condition:
+            return False
+    return True
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError('zstd archives need the zstandard package (see requirements-optional.txt); '
+                         'use gzip compression instead') from None
+    return zstandard
+
+
+def _open_archive_file(path, mode):
+    if path.endswith('.zst'):
+        zstandard = _zstandard()
+        if 'w' in mode:
+            return zstandard.open(path, mode, cctx=zstandard.ZstdCompressor(level=10))
+        return zstandard.open(path, mode)
+    return gzip.open(path, mode)
+
+
+def iter_file_rows(path, match):
+    # Stream one offloaded month, decoding and filtering a line at a time
+    with _open_archive_file(path, 'rt') as archive_file:
+        for line in archive_file:
+            row = json_util.loads(line)
+            if _matches(row, match):
+                yield row
+
+
+def iter_rows(db, match, start=None, end=None, batch_size=ARCHIVE_BATCH_SIZE):
+    # Oldest-first stream over every source holding [start, end), for exports
+    state = get_state(db)
+    for kind, name, month in reversed(ledger_sources(db, start, end)):
+        if kind == 'file':
+            yield from iter_file_rows(name, match)
+            continue
+        source_match = hot_match(state, match) if kind == 'hot' else match
+        cursor = db[name].find(source_match, no_cursor_timeout=True) \
+            .sort([('dateTime', 1), ('_id', 1)]).batch_size(batch_size)
+        try:
+            yield from cursor
+        finally:
+            cursor.close()
+
+
+def _type_totals(db, name):
+    return {str(row['_id']): {'count': row['count'], 'amount': row['amount']}
+            for row in db[name].aggregate([
+                {'$group': {'_id': '$type', 'count': {'$sum': 1}, 'amount': {'$sum': '$amount'}}}])}
+
+
+def archive_month(db, month, batch_size=ARCHIVE_BATCH_SIZE, pause=0, log=print):
+    # Move one month out of the hot set. Rows are copied in (dateTime, _id) order
+    # with _id preserved, so rerunning a batch after a crash only hits duplicate keys.
+    # Reads switch to the archive once the copy is complete; after every process
+    # has seen that switch, the hot rows are deleted in small batches. Each step is checkpointed and short, so
+    # the job can stop at any time and never holds up concurrent writes.
+    month_start, month_end = month_bounds(month)
+    name = collection_name(month)
+    in_range = {'dateTime': {'$gte': month_start, '$lt': month_end}}
+    progress = get_state(db, fresh=True).get('inProgress') or {}
+    if progress.get('month') != month:
+        progress = {'month': month, 'phase': 'copy', 'lastId': None}
+        db[name].create_indexes(INDEXES['transactions'])
+
+    while progress['phase'] == 'copy':
+        # Walk the month along the dateTime_id index from the last copied row
+        query = in_range
+        if progress['lastId']:
+            query = {'$and': [in_range, {'$or': [
+                {'dateTime': {'$gt': progress['lastDateTime']}},
+                {'dateTime': progress['lastDateTime'], '_id': {'$gt': progress['lastId']}}
+            ]}]}
+        batch = list(db['transactions'].find(query).sort([('dateTime', 1), ('_id', 1)]).limit(batch_size))
+        if not batch:
+            rows = db[name].estimated_document_count()
+            _save_state(db, {'$set': {f'months.{month}': {'storage': 'collection', 'rows': rows,
+                                                          'types': _type_totals(db, name)},
+                                      'cutoff': month_end,
+                                      'inProgress': {'month': month, 'phase': 'delete', 'lastId': None}}})
+            progress = {'month': month, 'phase': 'delete', 'lastId': None}
+            log(f"{month}: {rows} rows copied to {name}, reads now routed there")
+            break
+        try:
+            db[name].insert_many(batch, ordered=False)
+        except BulkWriteError as error:
+            if any(write_error['code'] != 11000 for write_error in error.details['writeErrors']):
+                raise
+        progress['lastDateTime'], progress['lastId'] = batch[-1]['dateTime'], batch[-1]['_id']
+        _save_state(db, {'$set': {'inProgress': progress}})
+        time.sleep(pause)
+
+    # Other processes may route reads from a cached state for up to CACHE_TTL;
+    # give them time to pick up the cutoff before its rows leave the hot set
+    time.sleep(CACHE_TTL)
+    deleted = 0
+    while True:
+        ids = [row['_id'] for row in db['transactions'].find(in_range, {'_id': 1}).limit(batch_size)]
+        if not ids:
+            break
+        deleted += db['transactions'].delete_many({'_id': {'$in': ids}}).deleted_count
+        time.sleep(pause)
+    _save_state(db, {'$unset': {'inProgress': ''}})
+    log(f"{month}: {deleted} rows removed from the hot set")
+
+
+def archive(db, hot_months=HOT_MONTHS, batch_size=ARCHIVE_BATCH_SIZE, pause=0, log=print):
+    # Archive every whole month older than the hot window, oldest first, finishing
+    # an interrupted month before starting the next one. Safe to run on a schedule.
+    if db['transactions'].find_one({'dateTime': {'$type': 'string'}}, {'_id': 1}):
+        raise ValueError('transactions still hold string dateTime values, which the archive cutoff would hide; '
+                         'run `flask --app main migrate-datetimes` first')
+    state = get_state(db, fresh=True)
+    if state.get('inProgress'):
+        archive_month(db, state['inProgress']['month'], batch_size, pause, log)
+
+    now = datetime.now()
+    first_hot = now.year * 12 + now.month - hot_months
+    boundary = datetime(first_hot // 12, first_hot % 12 + 1, 1)
+    oldest = db['transactions'].find_one({'dateTime': {'$type': 'date', '$lt': boundary}},
+                                         {'dateTime': 1}, sort=[('dateTime', 1)])
+    archived = []
+    month = month_of(oldest['dateTime']) if oldest else None
+    while month:
+        month_start, month_end = month_bounds(month)
+        if month_end > boundary:
+            break
+        if db['transactions'].find_one({'dateTime': {'$gte': month_start, '$lt': month_end}}, {'_id': 1}):
+            archive_month(db, month, batch_size, pause, log)
+            archived.append(month)
+        month = month_of(month_end)
+    return archived
+
+
+def offload_month(db, month, directory, compression='gzip', log=print):
+    # Turn an archive collection into a compressed NDJSON file (gzip uses the
+    # standard library, zstd the optional zstandard package) and drop the collection.
+    # The file is written under a temporary name and renamed once complete.
+    if compression == 'zstd':
+        _zstandard()
+    entry = get_state(db, fresh=True).get('months', {}).get(month)
+    if not entry or entry['storage'] != 'collection':
+        raise ValueError(f'{month} is not held in an archive collection')
+
+    os.makedirs(directory, exist_ok=True)
+    extension = 'zst' if compression == 'zstd' else 'gz'
+    path = os.path.join(directory, f'transactions-{month}.ndjson.{extension}')
+    partial_path = os.path.join(directory, f'transactions-{month}.partial.{extension}')
+    name = collection_name(month)
+    cursor = db[name].find({}, no_cursor_timeout=True).sort([('dateTime', 1), ('_id', 1)])
+    try:
+        with _open_archive_file(partial_path, 'wt') as archive_file:
+            for row in cursor:
+                archive_file.write(json_util.dumps(row) + '\n')
+    finally:
+        cursor.close()
+    os.replace(partial_path, path)
+
+    _save_state(db, {'$set': {f'months.{month}.storage': 'file', f'months.{month}.path': os.path.abspath(path)}})
+    # Likewise, readers still holding the old state keep querying the collection until it expires
+    time.sleep(CACHE_TTL)
+    db[name].drop()
+    log(f"{month}: offloaded to {path}")
+    return path
+
+
+def archived_type_totals(db):
+    # Per-type counts and amounts of every archived month, for reconcile_counters
+    totals = {}
+    for entry in get_state(db, fresh=True).get('months', {}).values():
+        for transaction_type, row in entry.get('types', {}).items():
+            total = totals.setdefault(transaction_type, {'count': 0, 'amount': 0})
+            total['count'] += row['count']
+            total['amount'] += row['amount']
+    return totals
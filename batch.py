@@ -0,0 +1,251 @@
+import csv
+import io
+import json
+import secrets
+from datetime import datetime
+
+from pymongo import ReturnDocument, UpdateOne
+
+from counters import record_transactions
+from parallel import batches
+from statements import record_statement_entries
+import transfers
+
+# Rows validated and written per round of $in lookup / bulk_write / insert_many
+CHUNK_SIZE = 1000
+# Per-row failures kept for the report; the rest are only counted
+MAX_REPORTED_FAILURES = 1000
+
+DEPOSIT = 'deposit'
+TRANSFER = 'transfer'
+
+
+def iter_rows(stream, file_format):
+    # Yield (row_number, dict) one line at a time so the file is never held in memory
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if file_format == 'ndjson':
+        for number, line in enumerate(text, start=1):
+            if line.strip():
+                try:
+                    value = json.loads(line)
+                except ValueError:
+                    value = None
+                # Valid JSON that isn't an object (5, [1], "x") is just as invalid a row
+                yield number, value if isinstance(value, dict) else None
+    else:
+        # Row 1 is the header
+        for number, row in enumerate(csv.DictReader(text), start=2):
+            yield number, row
+
+
+class BatchReport:
+    def __init__(self):
+        self.processed = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.failures = []
+
+    def fail(self, row_number, reason):
+        self.failed += 1
+        if len(self.failures) < MAX_REPORTED_FAILURES:
+            self.failures.append((row_number, reason))
+
+
+def _parse_amount(row):
+    amount = transfers.parse_amount(row.get('amount'))
+    amount = round(amount, 2) if amount is not None else None
+    return amount or None
+
+
+def _existing_accounts(db, account_numbers, session=None):
+    # One $in lookup validates every account number in the chunk
+    return {account['accountNumber'] for account in db['accounts'].find(
+        {'accountNumber': {'$in': list(account_numbers)}}, {'accountNumber': 1}, session=session)}
+
+
+def _add_credit(credits, account_number, amount):
+    total, count = credits.get(account_number, (0, 0))
+    credits[account_number] = (total + amount, count + 1)
+
+
+def _in_session(client, use_transaction, apply):
+    # With use_transaction the chunk commits or rolls back as a whole; apply may be
+    # retried on transient errors, so it only returns its results
+    if not use_transaction:
+        return apply(None)
+    with client.start_session() as session:
+        return session.with_transaction(apply)
+
+
+def _apply_credits(db, credits, entries, session=None):
+    # credits maps account number -> (total amount, row count). One bulk_write for
+    # the balances, one insert_many for the ledger, one $in read for the new balances.
+    db['accounts'].bulk_write([UpdateOne({'accountNumber': account_number}, {'$inc': {'balance': total}})
+                               for account_number, (total, _) in credits.items()], ordered=False, session=session)
+    db['transactions'].insert_many(entries, ordered=False, session=session)
+    record_transactions(db, entries, session=session)
+    balances = {account['accountNumber']: account['balance'] for account in db['accounts'].find(
+        {'accountNumber': {'$in': list(credits)}}, {'accountNumber': 1, 'balance': 1}, session=session)}
+    record_statement_entries(db, [(account_number, total, balances[account_number], entries[0]['dateTime'], count)
+                                  for account_number, (total, count) in credits.items()], session=session)
+
+
+def _deposit_chunk(client, db, chunk, officer_username, report, use_transaction):
+    valid = []
+    for row_number, row in chunk:
+        amount = _parse_amount(row) if row else None
+        if amount is None:
+            report.fail(row_number, 'Invalid row or amount')
+            continue
+        valid.append((row_number, str(row.get('account_number', '')).strip(), amount))
+
+    def apply(session):
+        known = _existing_accounts(db, {account_number for _, account_number, _ in valid}, session=session)
+        credits = {}
+        entries = []
+        failures = []
+        now = datetime.now()
+        for row_number, account_number, amount in valid:
+            if account_number not in known:
+                failures.append((row_number, f'Account {account_number} not found'))
+                continue
+            _add_credit(credits, account_number, amount)
+            entries.append({
+                "accountId": account_number,
+                "senderAccount": "Bank Officer - " + officer_username,  # Identifies the bank officer
+                "amount": amount,
+                "type": "Deposit",
+                "dateTime": now
+            })
+        if entries:
+            _apply_credits(db, credits, entries, session=session)
+        return len(entries), failures
+
+    succeeded, failures = _in_session(client, use_transaction, apply)
+    report.succeeded += succeeded
+    for row_number, reason in failures:
+        report.fail(row_number, reason)
+
+
+class _BalanceMoved(Exception):
+    # A sender's balance changed between the chunk's read and its debit
+    pass
+
+
+def _apply_transfer_rows(db, rows, session=None):
+    # Replay the rows in file order against one read of the balances, so a credit
+    # earlier in the file can fund a debit later in it, then write each account's
+    # net change. Returns (row_number, failure reason or None) per row.
+    accounts = {account['accountNumber']: account for account in db['accounts'].find(
+        {'accountNumber': {'$in': list({number for _, sender, receiver, _ in rows for number in (sender, receiver)})}},
+        {'accountNumber': 1, 'balance': 1, 'heldBalance': 1}, session=session)}
+    available = {number: account.get('balance', 0) - account.get('heldBalance', 0)
+                 for number, account in accounts.items()}
+    net = {}
+    sides = {}  # (account number, 'credit' | 'debit') -> (total, count)
+    entries = []
+    results = []
+    now = datetime.now()
+    for row_number, sender, receiver, amount in rows:
+        if sender not in accounts or receiver not in accounts:
+            results.append((row_number, f'Account {sender if sender not in accounts else receiver} not found'))
+            continue
+        if available[sender] < amount:
+            results.append((row_number, 'Insufficient funds'))
+            continue
+        available[sender] -= amount
+        available[receiver] += amount
+        net[sender] = net.get(sender, 0) - amount
+        net[receiver] = net.get(receiver, 0) + amount
+        _add_credit(sides, (sender, 'debit'), -amount)
+        _add_credit(sides, (receiver, 'credit'), amount)
+        entries.append({
+            "accountId": sender,
+            "receiverAccount": receiver,
+            "amount": -amount,  # Negative amount for debit
+            "type": "Transfer Debit",
+            "dateTime": now
+        })
+        entries.append({
+            "accountId": receiver,
+            "senderAccount": sender,
+            "amount": amount,
+            "type": "Transfer Credit",
+            "dateTime": now
+        })
+        results.append((row_number, None))
+    if not entries:
+        return results
+
+    # Net debits are conditional, so money moved elsewhere since the read is never
+    # overdrawn; credits can't fail and go out in one bulk_write
+    balances = {}
+    for number, change in net.items():
+        if change >= 0:
+            continue
+        account = db['accounts'].find_one_and_update(
+            {'accountNumber': number, **transfers.available_at_least(round(-change, 2))},
+            {'$inc': {'balance': change}}, projection={'balance': 1},
+            return_document=ReturnDocument.AFTER, session=session)
+        if account is None:
+            if session is None:
+                # Without a transaction, give back what this chunk already took
+                db['accounts'].bulk_write([UpdateOne({'accountNumber': debited}, {'$inc': {'balance': -net[debited]}})
+                                           for debited in balances], ordered=False)
+            raise _BalanceMoved(number)
+        balances[number] = account['balance']
+    credited = [number for number, change in net.items() if change >= 0]
+    if credited:
+        db['accounts'].bulk_write([UpdateOne({'accountNumber': number}, {'$inc': {'balance': net[number]}})
+                                   for number in credited], ordered=False, session=session)
+        balances.update({account['accountNumber']: account['balance'] for account in db['accounts'].find(
+            {'accountNumber': {'$in': credited}}, {'accountNumber': 1, 'balance': 1}, session=session)})
+    db['transactions'].insert_many(entries, ordered=False, session=session)
+    record_transactions(db, entries, session=session)
+    # Each side's balance_after excludes the other side, so whichever writes first
+    # fixes the same opening balance
+    record_statement_entries(db, [
+        (number, total, balances[number] - sides.get((number, 'credit' if side == 'debit' else 'debit'), (0, 0))[0],
+         now, count)
+        for (number, side), (total, count) in sides.items()
+    ], session=session)
+    return results
+
+
+def _transfer_chunk(client, db, chunk, report, use_transaction):
+    valid = []
+    for row_number, row in chunk:
+        amount = _parse_amount(row) if row else None
+        if amount is None:
+            report.fail(row_number, 'Invalid row or amount')
+            continue
+        valid.append((row_number, str(row.get('sender_account', '')).strip(),
+                      str(row.get('receiver_account', '')).strip(), amount))
+
+    try:
+        results = _in_session(client, use_transaction, lambda session: _apply_transfer_rows(db, valid, session))
+    except _BalanceMoved:
+        # Contended sender: apply the chunk row by row, still in file order
+        results = []
+        for row_number, sender, receiver, amount in valid:
+            result = transfers.execute_transfer(client, db, sender, receiver, amount, secrets.token_hex(16),
+                                                use_transaction=use_transaction)
+            results.append((row_number, None if result == transfers.COMPLETED
+                             else result.replace('_', ' ').capitalize()))
+    for row_number, reason in results:
+        if reason is None:
+            report.succeeded += 1
+        else:
+            report.fail(row_number, reason)
+
+
+def ingest(client, db, stream, kind, file_format='csv', officer_username='batch', use_transaction=False):
+    # Stream an uploaded file and apply it chunk by chunk, collecting per-row failures
+    report = BatchReport()
+    for chunk in batches(iter_rows(stream, file_format), CHUNK_SIZE):
+        report.processed += len(chunk)
+        if kind == TRANSFER:
+            _transfer_chunk(client, db, chunk, report, use_transaction)
+        else:
+            _deposit_chunk(client, db, chunk, officer_username, report, use_transaction)
+    return report
@@ -0,0 +1,79 @@
+"""Ledger insert benchmark: per-request inserts vs the group-commit LedgerWriter.
+
+Many threads each append ledger entries the way a burst of card payments or
+transfers would, waiting for every write to be acknowledged before the next.
+Both runs use the same (journaled by default) write concern. Runs against a
+scratch database so it never touches adb.
+
+    python benchmarks/ledger_group_commit.py --threads 64 --requests 20000 --batch-size 256 --flush-ms 2
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from pymongo import MongoClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import ledger_writer  # noqa: E402
+from indexes import ensure_indexes  # noqa: E402
+
+
+def entries_for(i, legs):
+    now = datetime.now()
+    return [{"accountId": f'account-{(i + leg) % 1000}', "receiverAccount": "Online Ecommerce", "amount": -1,
+             "type": "Debit Card Purchase", "dateTime": now} for leg in range(legs)]
+
+
+def run(name, db, writer, args):
+    db['transactions'].drop()
+    ensure_indexes(db)
+    latencies = []
+
+    def one(i):
+        started = time.perf_counter()
+        ledger_writer.insert_ledger_entries(db, entries_for(i, args.legs), writer=writer)
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        list(pool.map(one, range(args.requests)))
+    elapsed = time.perf_counter() - started
+
+    written = db['transactions'].count_documents({})
+    latencies.sort()
+    batches = f", {writer.entries_written / writer.flushes:.1f} entries per insert" if writer else ''
+    print(f"{name:>12}: {args.requests / elapsed:8.0f} requests/s, {written} entries, "
+          f"p50 {statistics.median(latencies) * 1000:.1f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f} ms{batches}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--uri', default='mongodb://localhost:27017/')
+    parser.add_argument('--database', default='adb_bench')
+    parser.add_argument('--threads', type=int, default=64)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--legs', type=int, default=1, help='Entries per request (2 for transfers)')
+    parser.add_argument('--batch-size', type=int, default=ledger_writer.LEDGER_BATCH_SIZE)
+    parser.add_argument('--flush-ms', type=float, default=ledger_writer.LEDGER_FLUSH_MS)
+    parser.add_argument('--queue-depth', type=int, default=ledger_writer.LEDGER_QUEUE_DEPTH)
+    parser.add_argument('--no-journal', action='store_true', help='Acknowledge without waiting for the journal')
+    args = parser.parse_args()
+
+    client = MongoClient(args.uri, maxPoolSize=args.threads, j=not args.no_journal)
+    db = client[args.database]
+    run('per-request', db, None, args)
+    writer = ledger_writer.LedgerWriter(db['transactions'], batch_size=args.batch_size, flush_ms=args.flush_ms,
+                                        queue_depth=args.queue_depth, journal=not args.no_journal)
+    run('group commit', db, writer, args)
+    writer.close()
+    client.drop_database(args.database)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Payment load test: form /process_payment vs the JSON authorize/capture API.
+
+Start the app against the same database the test uses (by default the
+scratch database adb_bench), then:
+
+    ADB_MONGO_DB=adb_bench python main.py
+    python benchmarks/payment_load.py --base-url http://127.0.0.1:5000 --concurrency 64 --payments 2000
+
+A throwaway account with its own debit card is created in --database for
+the run and removed afterwards, together with its ledger rows, statements
+and authorizations. When pointed at a live database, run
+`flask --app main reconcile-counters` afterwards to drop its payments from
+the dashboard totals.
+"""
+import argparse
+import json
+import secrets
+import statistics
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from pymongo import MongoClient
+
+
+def post(url, data=None, payload=None, timeout=30):
+    if payload is not None:
+        request = urllib.request.Request(url, data=json.dumps(payload).encode(),
+                                         headers={'Content-Type': 'application/json'})
+    else:
+        request = urllib.request.Request(url, data=urllib.parse.urlencode(data).encode())
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as error:
+        return error.code, error.read()
+
+
+def form_payment(base_url, card):
+    status, body = post(f'{base_url}/process_payment', data={'debitCardNumber': card, 'amount': '1'})
+    return status == 200 and body.startswith(b'Payment successful')
+
+
+def api_payment(base_url, card):
+    status, body = post(f'{base_url}/api/payments/authorize', payload={'debitCardNumber': card, 'amount': 1})
+    if status != 200:
+        return False
+    authorization_id = json.loads(body)['authorizationId']
+    status, _ = post(f'{base_url}/api/payments/{authorization_id}/capture', payload={})
+    return status == 200
+
+
+def run(name, pay, args, card):
+    latencies = []
+
+    def one(_):
+        started = time.perf_counter()
+        ok = pay(args.base_url, card)
+        latencies.append(time.perf_counter() - started)
+        return ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(one, range(args.payments)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"{name:>5}: {args.payments / elapsed:8.1f} payments/s, {results.count(True)} ok, "
+          f"p50 {statistics.median(latencies) * 1000:.1f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--base-url', default='http://127.0.0.1:5000')
+    parser.add_argument('--mongo-uri', default='mongodb://localhost:27017/')
+    parser.add_argument('--database', default='adb_bench', help='Database the app under test is using')
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--payments', type=int, default=2000)
+    args = parser.parse_args()
+
+    db = MongoClient(args.mongo_uri)[args.database]
+    account_number = 'load-' + secrets.token_hex(5)
+    card = secrets.token_hex(8)
+    db['accounts'].insert_one({'accountNumber': account_number, 'debitCard': card,
+                               'balance': args.payments * 2, 'CustomerId': None})
+    try:
+        run('form', form_payment, args, card)
+        run('api', api_payment, args, card)
+    finally:
+        db['accounts'].delete_one({'accountNumber': account_number})
+        db['transactions'].delete_many({'accountId': account_number})
+        db['authorizations'].delete_many({'accountNumber': account_number})
+        db['statements'].delete_many({'accountNumber': account_number})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+"""End-to-end route benchmark for the app built by main.create_app.
+
+Seeds a scratch database with a synthetic population, drives every route
+through the Flask test client from a pool of concurrent workers and writes
+a JSON report (p50/p95/p99 latency, throughput, Mongo commands per request).
+
+    python benchmarks/routes.py --customers 10000 --transactions 1000000 --output bench.json
+    python benchmarks/routes.py --mongomock --customers 500 --transactions 20000
+    python benchmarks/routes.py --baseline bench.json --output bench-new.json
+
+--mongomock only supports the query operators mongomock implements; a route
+whose pipeline uses anything else shows up as errors in the report and needs
+a real mongod.
+
+With --baseline the run exits non-zero when any route's p95 regresses by
+more than --threshold (default 20%).
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from pymongo import monitoring
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+TRANSACTION_TYPES = ['Transfer Debit', 'Transfer Credit', 'Deposit', 'Debit Card Purchase']
+PASSWORD = 'password'
+
+
+class CommandCounter(monitoring.CommandListener):
+    # Counts commands sent to mongod; registered before the app creates its client
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        with self._lock:
+            self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def account_number(i):
+    return f'{i:010x}'
+
+
+def seed(customers, transactions, batch_size=10000):
+    # Runs inside an app context so the app's own client and bcrypt settings are used
+    from counters import reconcile_counters
+    from credentials import sync_credentials
+    from extensions import get_db, hash_password
+    from indexes import ensure_indexes
+
+    db = get_db()
+    for name in ('customers', 'accounts', 'transactions', 'banks', 'category', 'admin', 'bankofficer',
+                 'credentials', 'counters', 'statements'):
+        db[name].drop()
+    ensure_indexes(db)
+
+    bank_id = db['banks'].insert_one({'name': 'Bench Bank'}).inserted_id
+    category_id = db['category'].insert_one({'AccountType': 'Savings'}).inserted_id
+    # Hashing once keeps seeding fast; every synthetic user shares the password
+    password_hash = hash_password(PASSWORD)
+    db['admin'].insert_one({'username': 'bench-admin', 'password': password_hash})
+
+    for start in range(0, customers, batch_size):
+        users = [{'fname': f'First{i}', 'lname': f'Last{i}', 'dob': '1990-01-01', 'address': f'{i} Bench St',
+                  'contact': '5550000000', 'ssn': f'{i:09d}', 'username': f'user{i}', 'password': password_hash,
+                  'isActive': True, 'accountTypeId': category_id}
+                 for i in range(start, min(start + batch_size, customers))]
+        ids = db['customers'].insert_many(users).inserted_ids
+        db['accounts'].insert_many([{'accountNumber': account_number(start + offset), 'CustomerId': customer_id,
+                                     'balance': 1_000_000, 'debitCard': f'{start + offset:016x}', 'bankId': bank_id}
+                                    for offset, customer_id in enumerate(ids)])
+
+    now = datetime.now()
+    for start in range(0, transactions, batch_size):
+        rows = []
+        for _ in range(min(batch_size, transactions - start)):
+            rows.append({'accountId': account_number(random.randrange(customers)),
+                         'receiverAccount': account_number(random.randrange(customers)),
+                         'amount': round(random.uniform(-500, 500), 2),
+                         'type': random.choice(TRANSACTION_TYPES),
+                         'dateTime': now - timedelta(seconds=random.randrange(730 * 86400))})
+        db['transactions'].insert_many(rows, ordered=False)
+
+    sync_credentials(db)
+    reconcile_counters(db)
+
+
+def route_specs(customers):
+    # name -> (method, path, form data factory, session factory)
+    def user():
+        return random.randrange(customers)
+
+    def customer_session(i):
+        return {'username': f'user{i}'}
+
+    admin_session = {'username': 'bench-admin', 'user_type': 'admin'}
+    return {
+        'login': ('POST', lambda i: '/login', lambda i: {'username': f'user{i}', 'password': PASSWORD}, None),
+        'dashboard': ('GET', lambda i: '/dashboard', None, customer_session),
+        'transfer': ('POST', lambda i: '/transfer',
+                     lambda i: {'sender_account': account_number(i), 'receiver_account': account_number(user()),
+                                'amount': '1.00'}, customer_session),
+        'process_payment': ('POST', lambda i: '/process_payment',
+                            lambda i: {'debitCardNumber': f'{i:016x}', 'amount': '1.00'}, None),
+        'view_transactions': ('GET', lambda i: '/view_transactions', None, lambda i: admin_session),
+        'admin_dashboard': ('GET', lambda i: '/admin_dashboard', None, lambda i: admin_session),
+        'manage_users': ('GET', lambda i: '/manage_users', None, lambda i: admin_session),
+        'get_account_name': ('POST', lambda i: '/get_account_name',
+                             lambda i: {'account_number': account_number(i)}, None),
+    }, user
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))]
+
+
+def run_route(app, spec, pick_user, requests, concurrency, counter):
+    method, path, data, session_factory = spec
+    latencies = []
+    errors = []
+    local = threading.local()
+
+    def one(_):
+        # Each worker thread gets its own test client (and cookie jar)
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+        i = pick_user()
+        if session_factory:
+            with local.client.session_transaction() as session:
+                session.clear()
+                session.update(session_factory(i))
+        started = time.perf_counter()
+        try:
+            # Streamed pages run their queries while the body is read, so it is
+            # consumed inside the timed section; errors raised mid-stream count too
+            response = local.client.open(path(i), method=method, data=data(i) if data else None)
+            response.get_data()
+            response.close()
+        except Exception as error:
+            errors.append(type(error).__name__)
+        else:
+            if response.status_code >= 500:
+                errors.append(response.status_code)
+        latencies.append(time.perf_counter() - started)
+
+    commands_before = counter.count
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - started
+    commands = counter.count - commands_before
+
+    latencies.sort()
+    return {
+        'requests': requests,
+        'errors': len(errors),
+        'throughput': round(requests / elapsed, 2),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        # Command monitoring does not fire for mongomock
+        'mongo_ops_per_request': round(commands / requests, 2) if commands else None,
+    }
+
+
+def compare(report, baseline, threshold):
+    regressions = []
+    for name, result in report['routes'].items():
+        before = baseline.get('routes', {}).get(name)
+        if before and result['p95_ms'] > before['p95_ms'] * (1 + threshold):
+            regressions.append(f"{name}: p95 {before['p95_ms']} ms -> {result['p95_ms']} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--uri', default='mongodb://localhost:27017/')
+    parser.add_argument('--database', default='adb_bench')
+    parser.add_argument('--mongomock', action='store_true', help='use mongomock instead of a running mongod')
+    parser.add_argument('--customers', type=int, default=1000)
+    parser.add_argument('--transactions', type=int, default=100000)
+    parser.add_argument('--requests', type=int, default=200, help='requests per route')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--routes', default='', help='comma-separated subset of routes')
+    parser.add_argument('--skip-seed', action='store_true', help='reuse the data from a previous run')
+    parser.add_argument('--output', default='bench.json')
+    parser.add_argument('--baseline', help='previous report to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2)
+    args = parser.parse_args()
+
+    counter = CommandCounter()
+    monitoring.register(counter)
+    if args.mongomock:
+        import mongomock
+        import pymongo
+        pymongo.MongoClient = mongomock.MongoClient
+    from main import create_app
+    app = create_app({'MONGO_URI': args.uri, 'MONGO_DB': args.database})
+
+    if not args.skip_seed:
+        started = time.perf_counter()
+        with app.app_context():
+            seed(args.customers, args.transactions)
+        print(f"Seeded {args.customers} customers and {args.transactions} transactions "
+              f"in {time.perf_counter() - started:.1f}s")
+
+    specs, pick_user = route_specs(args.customers)
+    selected = [name for name in args.routes.split(',') if name] or list(specs)
+    report = {
+        'meta': {'timestamp': datetime.now().isoformat(), 'customers': args.customers,
+                 'transactions': args.transactions, 'requests': args.requests,
+                 'concurrency': args.concurrency, 'backend': 'mongomock' if args.mongomock else args.uri},
+        'routes': {}
+    }
+    for name in selected:
+        result = run_route(app, specs[name], pick_user, args.requests, args.concurrency, counter)
+        report['routes'][name] = result
+        print(f"{name:>18}: {result['throughput']:8.1f} req/s  p50 {result['p50_ms']:8.2f} ms  "
+              f"p95 {result['p95_ms']:8.2f} ms  p99 {result['p99_ms']:8.2f} ms  "
+              f"ops/req {result['mongo_ops_per_request']}  errors {result['errors']}")
+
+    with open(args.output, 'w') as output:
+        json.dump(report, output, indent=2)
+    print(f"Report written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(report, json.load(baseline_file), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Contention benchmark: many concurrent transfers out of one hot account.
+
+Compares the original read-check-update transfer (five round trips, racy
+balance check) with transfers.execute_transfer. Runs against a scratch
+database so it never touches adb.
+
+    python benchmarks/transfer_contention.py --threads 32 --transfers 5000
+"""
+import argparse
+import os
+import secrets
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from pymongo import MongoClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import transfers  # noqa: E402
+from indexes import ensure_indexes  # noqa: E402
+
+HOT_ACCOUNT = 'hot-account'
+
+
+def legacy_transfer(client, db, sender, receiver, amount, idempotency_key, use_transaction=False):
+    # The transfer route as it was before the atomic engine
+    sender_account = db['accounts'].find_one({'accountNumber': sender})
+    if not (sender_account and sender_account['balance'] >= amount):
+        return transfers.INSUFFICIENT_FUNDS
+    db['accounts'].update_one({'accountNumber': sender}, {'$inc': {'balance': -amount}})
+    db['accounts'].update_one({'accountNumber': receiver}, {'$inc': {'balance': amount}})
+    now = datetime.now()
+    db['transactions'].insert_one({"accountId": sender, "receiverAccount": receiver, "amount": -amount,
+                                   "type": "Transfer Debit", "dateTime": now})
+    db['transactions'].insert_one({"accountId": receiver, "senderAccount": sender, "amount": amount,
+                                   "type": "Transfer Credit", "dateTime": now})
+    return transfers.COMPLETED
+
+
+def seed(db, receivers, opening_balance):
+    db['accounts'].drop()
+    db['transactions'].drop()
+    ensure_indexes(db)
+    db['accounts'].insert_many(
+        [{'accountNumber': HOT_ACCOUNT, 'balance': opening_balance, 'debitCard': 'hot-card'}] +
+        [{'accountNumber': f'receiver-{i}', 'balance': 0, 'debitCard': f'card-{i}'} for i in range(receivers)])
+
+
+def run(name, transfer, client, db, args):
+    # Opening balance covers only half the attempts, so a correct engine must refuse the rest
+    seed(db, args.receivers, opening_balance=args.transfers // 2)
+
+    def one(i):
+        return transfer(client, db, HOT_ACCOUNT, f'receiver-{i % args.receivers}', 1,
+                        secrets.token_hex(16), use_transaction=args.transactions)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        results = list(pool.map(one, range(args.transfers)))
+    elapsed = time.perf_counter() - started
+
+    completed = results.count(transfers.COMPLETED)
+    final_balance = db['accounts'].find_one({'accountNumber': HOT_ACCOUNT})['balance']
+    print(f"{name:>8}: {args.transfers / elapsed:8.0f} transfers/s, {completed} completed, "
+          f"final hot balance {final_balance}{'  <-- OVERDRAWN' if final_balance < 0 else ''}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--uri', default='mongodb://localhost:27017/')
+    parser.add_argument('--database', default='adb_bench')
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--transfers', type=int, default=5000)
+    parser.add_argument('--receivers', type=int, default=100)
+    parser.add_argument('--transactions', action='store_true', help='use multi-document transactions')
+    args = parser.parse_args()
+
+    client = MongoClient(args.uri, maxPoolSize=args.threads)
+    db = client[args.database]
+    run('legacy', legacy_transfer, client, db, args)
+    run('atomic', transfers.execute_transfer, client, db, args)
+    client.drop_database(args.database)
+
+
+if __name__ == '__main__':
+    main()
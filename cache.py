@@ -0,0 +1,100 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class LocalBackend:
+    # In-process stand-in for a shared cache server (same get/set/delete surface
+    # as the subset of redis-py used here), handy for tests and single-process runs
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value, expires = self._data.get(key, (None, 0))
+            if value is not None and expires < time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + (ex or float('inf')))
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+
+def make_backend(url):
+    # None keeps caching in-process only; "local" uses LocalBackend; anything else is a redis URL
+    if not url:
+        return None
+    if url == 'local':
+        return LocalBackend()
+    import redis
+    return redis.Redis.from_url(url)
+
+
+class ReadThroughCache:
+    # LRU + TTL cache in front of a loader. With a shared store the entries live
+    # only there, so every worker sees an invalidation as soon as it is made; the
+    # in-process LRU is used when there is no shared store. Shared entries are
+    # serialised with codec (json, or bson.json_util for dates and ObjectIds).
+    def __init__(self, name, ttl=60, max_entries=10000, backend=None, codec=json):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.backend = backend
+        self.codec = codec
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _shared_key(self, key):
+        return f'adb:{self.name}:{key}'
+
+    def get(self, key, loader):
+        if self.backend is not None:
+            raw = self.backend.get(self._shared_key(key))
+            with self._lock:
+                self.misses += raw is None
+                self.hits += raw is not None
+            if raw is not None:
+                return self.codec.loads(raw)
+            value = loader()
+            self.backend.set(self._shared_key(key), self.codec.dumps(value), ex=self.ttl)
+            return value
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+        value = loader()
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = (value, now + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+        if self.backend is not None and keys:
+            self.backend.delete(*[self._shared_key(key) for key in keys])
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries),
+                'hitRatio': round(self.hits / lookups, 4) if lookups else None}
@@ -0,0 +1,192 @@
+import click
+from flask import Blueprint, current_app
+
+import archive
+import batch
+import datagen
+import payments
+import reconcile
+from counters import reconcile_counters
+from credentials import sync_credentials
+from export import iter_export
+from extensions import get_client, get_db, hash_password
+from indexes import check_query_plans, ensure_indexes
+from ledger import TRANSACTION_TYPES, transaction_filters_match, transaction_filters_range
+from migrations import migrate_transaction_datetimes
+from statements import rebuild_statements
+
+# Maintenance commands, registered at the top level of the ``flask`` CLI
+bp = Blueprint('commands', __name__, cli_group=None)
+
+
+@bp.cli.command('ensure-indexes')
+def ensure_indexes_command():
+    # Idempotently create every index in the manifest
+    for collection_name, names in ensure_indexes(get_db()).items():
+        click.echo(f"{collection_name}: {', '.join(names)}")
+
+
+@bp.cli.command('check-indexes')
+def check_indexes_command():
+    # Fail when any route query is planned as a collection scan
+    failures = check_query_plans(get_db())
+    for route, collection_name, command in failures:
+        click.echo(f"COLLSCAN in {route} on {collection_name}: {command}", err=True)
+    if failures:
+        raise SystemExit(1)
+    click.echo('All route queries are index-backed')
+
+
+@bp.cli.command('migrate-datetimes')
+@click.option('--batch-size', default=1000, show_default=True)
+def migrate_datetimes_command(batch_size):
+    # Resumable conversion of legacy string dateTime values to BSON dates
+    converted = migrate_transaction_datetimes(get_db(), batch_size=batch_size, log=click.echo)
+    click.echo(f"Done, {converted} transactions converted")
+
+
+@bp.cli.command('sync-credentials')
+def sync_credentials_command():
+    # Backfill the credentials collection from admin, bankofficer and customers
+    click.echo(f"{sync_credentials(get_db())} credentials added")
+
+
+@bp.cli.command('reconcile-counters')
+def reconcile_counters_command():
+    # Rebuild the dashboard counters from scratch
+    totals = reconcile_counters(get_db())
+    click.echo(f"customers={totals['customers']} bankofficers={totals['bankofficers']} "
+               f"admins={totals['admins']} transactions={totals['transactions']}")
+
+
+@bp.cli.command('rebuild-statements')
+@click.option('--account', default=None, help='Only rebuild this account number')
+def rebuild_statements_command(account):
+    # Recompute the daily statement snapshots from the ledger
+    click.echo(f"{rebuild_statements(get_db(), account_number=account)} statement snapshots written")
+
+
+@bp.cli.command('batch-ingest')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--kind', type=click.Choice([batch.DEPOSIT, batch.TRANSFER]), default=batch.DEPOSIT, show_default=True)
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'ndjson']), default='csv', show_default=True)
+@click.option('--officer', default='batch', show_default=True, help='Bank officer recorded on deposits')
+def batch_ingest_command(path, kind, file_format, officer):
+    # Apply a CSV/NDJSON file of deposits or transfers in chunked bulk writes
+    with open(path, 'rb') as stream:
+        report = batch.ingest(get_client(), get_db(), stream, kind, file_format=file_format,
+                              officer_username=officer, use_transaction=current_app.config['MONGO_TRANSACTIONS'])
+    for row_number, reason in report.failures:
+        click.echo(f"row {row_number}: {reason}", err=True)
+    click.echo(f"{report.processed} rows, {report.succeeded} applied, {report.failed} failed")
+
+
+@bp.cli.command('generate-data')
+@click.option('--customers', default=100000, show_default=True)
+@click.option('--transactions', default=10000000, show_default=True, help='Approximate ledger rows')
+@click.option('--days', default=730, show_default=True, help='Spread the ledger over this many past days')
+@click.option('--workers', default=None, type=int, help='Worker processes (default: CPU count)')
+@click.option('--batch-size', default=datagen.BATCH_SIZE, show_default=True)
+@click.option('--seed', default=0, show_default=True)
+@click.option('--password', default='password', show_default=True, help='Password of every synthetic customer')
+@click.option('--drop', is_flag=True, help='Drop the generated collections first')
+@click.option('--statements', is_flag=True, help='Also rebuild the daily statement snapshots')
+def generate_data_command(customers, transactions, days, workers, batch_size, seed, password, drop, statements):
+    # Fill the configured database with a consistent synthetic dataset for scaling tests
+    try:
+        datagen.generate(current_app.config['MONGO_URI'], current_app.config['MONGO_DB'], customers, transactions,
+                         hash_password(password), workers=workers, batch_size=batch_size, seed=seed, days=days,
+                         drop=drop, log=click.echo)
+    except ValueError as error:
+        raise click.ClickException(str(error))
+    db = get_db()
+    ensure_indexes(db)
+    click.echo(f"{sync_credentials(db)} credentials added")
+    reconcile_counters(db)
+    if statements:
+        click.echo(f"{rebuild_statements(db)} statement snapshots written")
+
+
+@bp.cli.command('restore-dump')
+@click.argument('path', type=click.Path(exists=True))
+@click.option('--batch-size', default=datagen.BATCH_SIZE, show_default=True)
+@click.option('--drop', is_flag=True, help='Drop each collection before restoring it')
+def restore_dump_command(path, batch_size, drop):
+    # Stream mongodump .bson files (e.g. the bundled adb/ directory) into the configured database
+    db = get_db()
+    restored = datagen.restore_dump(db, path, batch_size=batch_size, drop=drop, log=click.echo)
+    click.echo(f"Restored {sum(restored.values())} documents into {len(restored)} collections")
+    # Restored users need credentials to log in, and the dashboards need their totals
+    ensure_indexes(db)
+    click.echo(f"{sync_credentials(db)} credentials added")
+    reconcile_counters(db)
+
+
+@bp.cli.command('export-transactions')
+@click.argument('path', type=click.Path(dir_okay=False))
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'ndjson']), default='csv', show_default=True)
+@click.option('--gzip', 'compress', is_flag=True, help='Write gzip-compressed output')
+@click.option('--account', default='', help='Only this account number')
+@click.option('--type', 'transaction_type', type=click.Choice(TRANSACTION_TYPES), default=None)
+@click.option('--start-date', default='', help='YYYY-MM-DD, inclusive')
+@click.option('--end-date', default='', help='YYYY-MM-DD, inclusive')
+def export_transactions_command(path, file_format, compress, account, transaction_type, start_date, end_date):
+    # Stream the ledger to a file with constant memory
+    filters = {'account': account, 'type': transaction_type or '', 'start_date': start_date, 'end_date': end_date}
+    start, end = transaction_filters_range(filters)
+    with open(path, 'wb') as output:
+        for chunk in iter_export(get_db(), transaction_filters_match(filters), file_format=file_format,
+                                 compress=compress, start=start, end=end):
+            output.write(chunk)
+    click.echo(f"Exported to {path}")
+
+
+@bp.cli.command('archive-transactions')
+@click.option('--hot-months', default=archive.HOT_MONTHS, show_default=True, help='Months kept in the hot set')
+@click.option('--batch-size', default=archive.ARCHIVE_BATCH_SIZE, show_default=True)
+@click.option('--pause', default=0.0, show_default=True, help='Seconds to sleep between batches')
+def archive_transactions_command(hot_months, batch_size, pause):
+    # Move whole months older than the hot window into monthly archive collections;
+    # resumes an interrupted month first, so it can run from cron
+    try:
+        archived = archive.archive(get_db(), hot_months=hot_months, batch_size=batch_size, pause=pause,
+                                   log=click.echo)
+    except ValueError as error:
+        raise click.ClickException(str(error))
+    click.echo(f"{len(archived)} months archived")
+
+
+@bp.cli.command('offload-archive')
+@click.argument('month')
+@click.option('--directory', default='archive', show_default=True, type=click.Path(file_okay=False))
+@click.option('--compression', type=click.Choice(['gzip', 'zstd']), default='gzip', show_default=True,
+              help='zstd needs the zstandard package')
+def offload_archive_command(month, directory, compression):
+    # Replace an archive collection (YYYY-MM) with a compressed NDJSON file
+    try:
+        archive.offload_month(get_db(), month, directory, compression=compression, log=click.echo)
+    except ValueError as error:
+        raise click.ClickException(str(error))
+
+
+@bp.cli.command('expire-authorizations')
+def expire_authorizations_command():
+    # Release card holds past their expiresAt; run periodically (e.g. from cron)
+    click.echo(f"{payments.expire_authorizations(get_db())} authorizations expired")
+
+
+@bp.cli.command('reconcile-balances')
+@click.option('--mode', type=click.Choice(['full', 'incremental']), default='incremental', show_default=True)
+@click.option('--engine', type=click.Choice(reconcile.ENGINES), default='server', show_default=True,
+              help='Sum with $group on the server or with NumPy over streamed rows')
+@click.option('--partitions', default=None, type=int, help='Account ranges (default: 4 per worker)')
+@click.option('--workers', default=None, type=int, help='Worker processes (default: CPU count)')
+@click.option('--batch-size', default=reconcile.BATCH_SIZE, show_default=True)
+@click.option('--report', default='reconciliation.csv', show_default=True, type=click.Path(dir_okay=False))
+def reconcile_balances_command(mode, engine, partitions, workers, batch_size, report):
+    # Check every balance against its ledger; resumes an interrupted run first
+    summary, discrepancies = reconcile.reconcile(current_app.config['MONGO_URI'], current_app.config['MONGO_DB'],
+                                                 mode=mode, engine=engine, partitions=partitions, workers=workers,
+                                                 batch_size=batch_size, log=click.echo)
+    reconcile.write_report(report, discrepancies)
+    click.echo(f"Report written to {report}")
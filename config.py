@@ -0,0 +1,60 @@
+import os
+
+
+class DefaultConfig:
+    SECRET_KEY = os.environ.get('ADB_SECRET_KEY', 'your_secret_key')
+
+    # MongoDB. ADB_MONGO_URI / ADB_MONGO_DB point the app at another server or
+    # database (e.g. for benchmarks). The client is created lazily in each process.
+    MONGO_URI = os.environ.get('ADB_MONGO_URI', 'mongodb://localhost:27017/')
+    MONGO_DB = os.environ.get('ADB_MONGO_DB', 'adb')
+    MONGO_MAX_POOL_SIZE = int(os.environ.get('ADB_MONGO_MAX_POOL_SIZE', 100))
+    # Connections each worker keeps open (and opens during warm-up)
+    MONGO_MIN_POOL_SIZE = int(os.environ.get('ADB_MONGO_MIN_POOL_SIZE', 0))
+    # How long a request may wait for a pooled connection or a server before failing
+    MONGO_TIMEOUT_MS = int(os.environ.get('ADB_MONGO_TIMEOUT_MS', 5000))
+    # None keeps the server defaults; e.g. 'majority' or 1 for writes, 'majority' for reads
+    MONGO_WRITE_CONCERN = os.environ.get('ADB_MONGO_WRITE_CONCERN')
+    MONGO_READ_CONCERN = os.environ.get('ADB_MONGO_READ_CONCERN')
+    MONGO_READ_PREFERENCE = os.environ.get('ADB_MONGO_READ_PREFERENCE', 'primary')
+    # Multi-document transactions need a replica set; leave off for a standalone mongod
+    MONGO_TRANSACTIONS = os.environ.get('ADB_MONGO_TRANSACTIONS') == '1'
+
+    # bcrypt work factor; stored hashes with a different cost are rehashed on login
+    BCRYPT_LOG_ROUNDS = 12
+    # Upper bound on concurrent bcrypt operations so a login storm can't starve other routes
+    BCRYPT_WORKERS = 4
+
+    # JSON payment API: blocking Mongo calls run on this pool, bounded by a per-request timeout
+    PAYMENT_API_WORKERS = 32
+    PAYMENT_API_TIMEOUT = 10
+
+    # Read-through caches for account names and reference data. CACHE_BACKEND may be
+    # a redis URL shared by all workers, 'local' for the in-process stand-in, or None.
+    CACHE_TTL = 60
+    CACHE_MAX_ENTRIES = 10000
+    CACHE_BACKEND = os.environ.get('ADB_CACHE_BACKEND')
+
+    # Shared directory through which the workers of a multi-process server combine
+    # their /metrics histograms (see instrumentation.py); None reports this process only
+    METRICS_DIR = os.environ.get('ADB_METRICS_DIR')
+    METRICS_SNAPSHOT_SECONDS = 2
+
+    # Opt-in group commit for ledger inserts: entries from concurrent requests share
+    # one insert_many, flushed at LEDGER_BATCH_SIZE entries or LEDGER_FLUSH_MS after
+    # the first one queued. Each request still waits for its own acknowledgement
+    # (journaled with LEDGER_JOURNAL); past LEDGER_QUEUE_DEPTH waiting requests new ones block.
+    LEDGER_GROUP_COMMIT = os.environ.get('ADB_LEDGER_GROUP_COMMIT') == '1'
+    LEDGER_BATCH_SIZE = 256
+    LEDGER_FLUSH_MS = 2
+    LEDGER_QUEUE_DEPTH = 4096
+    LEDGER_JOURNAL = True
+
+    # Requests slower than this, or issuing more Mongo commands, log their command sequence
+    SLOW_REQUEST_MS = 500
+    SLOW_REQUEST_MAX_QUERIES = 20
+
+    # Blueprints to register; a worker only serving the payment API can list just 'ecommerce'
+    BLUEPRINTS = ['auth', 'customer', 'admin', 'ecommerce']
+    # flask CLI commands (commands.py); off in the WSGI entry point
+    CLI_COMMANDS = True
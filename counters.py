@@ -0,0 +1,92 @@
+import random
+
+from flask import has_app_context
+
+from archive import archived_type_totals, get_state, hot_match
+from extensions import caches
+
+# Dashboard totals are split across COUNTER_SLOTS documents (_id 'totals:<k>').
+# Every write path adds its deltas to one slot picked at random with a single $inc,
+# so concurrent transactions on unrelated accounts rarely touch the same document
+# and don't WriteConflict on it; dashboards read all slots with one find and sum them.
+COUNTERS_ID = 'totals'
+COUNTER_SLOTS = 16
+SLOT_IDS = [f'{COUNTERS_ID}:{slot}' for slot in range(COUNTER_SLOTS)]
+
+# Seconds a dashboard read may be served from the counters cache
+CACHE_TTL = 5
+
+
+def increment(db, fields, session=None):
+    db['counters'].update_one({'_id': random.choice(SLOT_IDS)}, {'$inc': fields}, upsert=True, session=session)
+
+
+def record_transactions(db, entries, session=None):
+    # Per-type counts and amounts for a batch of ledger entries
+    fields = {'transactions': len(entries)}
+    for entry in entries:
+        count_key = f"types.{entry['type']}.count"
+        amount_key = f"types.{entry['type']}.amount"
+        fields[count_key] = fields.get(count_key, 0) + 1
+        fields[amount_key] = fields.get(amount_key, 0) + entry['amount']
+    increment(db, fields, session=session)
+
+
+def _add(totals, slot):
+    for key, value in slot.items():
+        if key == '_id':
+            continue
+        if isinstance(value, dict):
+            _add(totals.setdefault(key, {}), value)
+        else:
+            totals[key] = totals.get(key, 0) + value
+
+
+def _sum_slots(db):
+    totals = {}
+    for slot in db['counters'].find({'_id': {'$in': SLOT_IDS}}):
+        _add(totals, slot)
+    return totals
+
+
+def get_counters(db):
+    return caches()['counters'].get(db.name, lambda: _sum_slots(db))
+
+
+def ensure_counters(db):
+    # Seed the totals on first start so dashboards don't report zeros
+    if db['counters'].find_one({'_id': {'$in': SLOT_IDS}}, {'_id': 1}) is None:
+        reconcile_counters(db)
+
+
+def reconcile_counters(db):
+    # Rebuild every total from the source collections
+    totals = {
+        'customers': db['customers'].count_documents({}),
+        'bankofficers': db['bankofficer'].count_documents({}),
+        'admins': db['admin'].count_documents({}),
+        'transactions': 0,
+        'types': {}
+    }
+    # Rows of a month still being deleted from the hot set are already in its
+    # archive totals, so only rows from the cutoff on are counted here
+    for row in db['transactions'].aggregate([
+        {'$match': hot_match(get_state(db, fresh=True), {})},
+        {'$group': {'_id': '$type', 'count': {'$sum': 1}, 'amount': {'$sum': '$amount'}}}
+    ]):
+        totals['transactions'] += row['count']
+        totals['types'][str(row['_id'])] = {'count': row['count'], 'amount': row['amount']}
+    # Months moved out of the hot set still count towards the totals
+    for transaction_type, row in archived_type_totals(db).items():
+        total = totals['types'].setdefault(transaction_type, {'count': 0, 'amount': 0})
+        total['count'] += row['count']
+        total['amount'] += row['amount']
+        totals['transactions'] += row['count']
+
+    # The rebuilt totals go into the first slot and every other slot starts over;
+    # the single pre-slot 'totals' document is dropped along with them
+    db['counters'].replace_one({'_id': SLOT_IDS[0]}, totals, upsert=True)
+    db['counters'].delete_many({'_id': {'$in': SLOT_IDS[1:] + [COUNTERS_ID]}})
+    if has_app_context():
+        caches()['counters'].invalidate(db.name)
+    return totals
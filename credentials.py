@@ -0,0 +1,82 @@
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+# Source collection for each login role. When a username exists in several
+# collections the first role listed wins, matching the old login order.
+ROLE_COLLECTIONS = [
+    ('admin', 'admin'),
+    ('bankofficer', 'bankofficer'),
+    ('customer', 'customers'),
+]
+
+
+def save_credential(db, username, password_hash, role, user_id, is_active=True):
+    # One document per login so login() costs a single indexed lookup
+    db['credentials'].insert_one({
+        'username': username,
+        'password': password_hash,
+        'role': role,
+        'userId': user_id,
+        'isActive': is_active
+    })
+
+
+def set_credential_fields(db, role, user_id, fields):
+    db['credentials'].update_one({'role': role, 'userId': user_id}, {'$set': fields})
+
+
+def delete_credential(db, role, user_id):
+    db['credentials'].delete_one({'role': role, 'userId': user_id})
+
+
+def update_password_hash(db, credential, password_hash):
+    # Keep the role collection in step with the credential it was copied from
+    db['credentials'].update_one({'_id': credential['_id']}, {'$set': {'password': password_hash}})
+    source = dict(ROLE_COLLECTIONS)[credential['role']]
+    db[source].update_one({'_id': credential['userId']}, {'$set': {'password': password_hash}})
+
+
+def hash_rounds(password_hash):
+    # bcrypt hashes look like $2b$12$<salt+digest>; the second field is the cost
+    try:
+        return int(password_hash.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def sync_credentials(db, batch_size=1000):
+    # Backfill credentials from the role collections. Existing entries keep their
+    # password ($setOnInsert), so this is safe to rerun; isActive always follows
+    # the role collection, which approve_user updates as well.
+    synced = 0
+    for role, collection_name in ROLE_COLLECTIONS:
+        requests = []
+        for user in db[collection_name].find({}, {'username': 1, 'password': 1, 'isActive': 1}):
+            if not user.get('username') or not user.get('password'):
+                continue
+            # Customers must be approved first; staff accounts have no approval step
+            is_active = user.get('isActive', role != 'customer')
+            requests.append(UpdateOne({'username': user['username']}, {'$setOnInsert': {
+                'password': user['password'],
+                'role': role,
+                'userId': user['_id'],
+                'isActive': is_active
+            }}, upsert=True))
+            requests.append(UpdateOne({'role': role, 'userId': user['_id']}, {'$set': {'isActive': is_active}}))
+            if len(requests) >= batch_size:
+                synced += db['credentials'].bulk_write(requests, ordered=False).upserted_count
+                requests = []
+        if requests:
+            synced += db['credentials'].bulk_write(requests, ordered=False).upserted_count
+    return synced
+
+
+def ensure_credentials(db):
+    # First start only: once every existing user has a credential, the write paths
+    # (registration, approval, edits) keep them in step, so later startups skip the
+    # full pass over the role collections. sync-credentials still reruns it on demand.
+    if db['migrations'].find_one({'_id': 'credentials'}, {'_id': 1}) is None:
+        synced = sync_credentials(db)
+        db['migrations'].update_one({'_id': 'credentials'},
+                                    {'$set': {'synced': synced, 'completedAt': datetime.now()}}, upsert=True)
@@ -0,0 +1,89 @@
+import json
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo.collation import Collation
+
+# Customer listing for manage_users and approve_users: one bounded, index-backed
+# query per page, keyset-paginated on (sort field, _id).
+
+USERS_PAGE_SIZE = 50
+
+# Case-insensitive comparisons; the customers search/sort indexes are built with
+# the same collation, which a query must match to use them
+CASE_INSENSITIVE = Collation(locale='en', strength=2)
+
+# Everything the listing pages render; password hashes and SSNs never leave the server
+LISTING_PROJECTION = {'username': 1, 'fname': 1, 'lname': 1, 'name': 1, 'contact': 1}
+
+# Prefix search runs one indexed range per field, combined with $or. Legacy
+# customers (e.g. the bundled dump) keep their full name in `name`.
+SEARCH_FIELDS = ['username', 'fname', 'lname', 'name', 'contact']
+
+# Sort option -> (field, direction); ties are broken by _id in the same direction
+SORT_OPTIONS = {
+    'username': ('username', 1),
+    'lname': ('lname', 1),
+    'newest': ('_id', -1),
+}
+SORT_LABELS = {'username': 'Username', 'lname': 'Last name', 'newest': 'Newest first'}
+DEFAULT_SORT = 'username'
+
+
+def prefix_clause(query):
+    # U+FFFF sorts after every character under ICU collation, so [q, q + U+FFFF)
+    # covers exactly the values starting with q, case-insensitively
+    query = query.strip()
+    if not query:
+        return None
+    return {'$or': [{field: {'$gte': query, '$lt': query + '\uffff'}} for field in SEARCH_FIELDS]}
+
+
+def encode_cursor(sort, row):
+    field, _ = SORT_OPTIONS[sort]
+    return json.dumps([row.get(field) if field != '_id' else None, str(row['_id'])])
+
+
+def decode_cursor(cursor):
+    try:
+        value, user_id = json.loads(cursor)
+        return (value if isinstance(value, str) else None), ObjectId(user_id)
+    except (ValueError, TypeError, InvalidId):
+        return None
+
+
+def cursor_clause(sort, cursor):
+    field, direction = SORT_OPTIONS[sort]
+    value, user_id = cursor
+    if field == '_id':
+        return {'_id': {'$lt' if direction < 0 else '$gt': user_id}}
+    if value is None:
+        # Rows missing the field sort first; comparisons don't cross BSON types,
+        # so continue with the remaining missing ones, then every string value
+        return {'$or': [{field: None, '_id': {'$gt': user_id}}, {field: {'$gte': ''}}]}
+    return {'$or': [{field: {'$gt': value}}, {field: value, '_id': {'$gt': user_id}}]}
+
+
+def listing_query(base, search='', sort=DEFAULT_SORT, cursor=None):
+    clauses = [base] if base else []
+    search = prefix_clause(search)
+    if search:
+        clauses.append(search)
+    if cursor:
+        clauses.append(cursor_clause(sort, cursor))
+    if not clauses:
+        return {}
+    return clauses[0] if len(clauses) == 1 else {'$and': clauses}
+
+
+def find_page(db, base, search='', sort=DEFAULT_SORT, cursor=None, limit=USERS_PAGE_SIZE):
+    # Cursor over limit + 1 rows, for ledger.KeysetPage
+    field, direction = SORT_OPTIONS[sort]
+    order = [(field, direction)] if field == '_id' else [(field, direction), ('_id', direction)]
+    return db['customers'].find(listing_query(base, search, sort, cursor), LISTING_PROJECTION,
+                                collation=CASE_INSENSITIVE).sort(order).limit(limit + 1)
+
+
+def listing_args(args):
+    sort = args.get('sort') if args.get('sort') in SORT_OPTIONS else DEFAULT_SORT
+    return {'q': args.get('q', '').strip()[:100], 'sort': sort}
@@ -0,0 +1,225 @@
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+import bson
+from bson import ObjectId
+from pymongo import MongoClient
+from pymongo.errors import BulkWriteError
+
+from parallel import batches, process_pool
+
+# Documents per insert_many round trip
+BATCH_SIZE = 10000
+
+# Share of generated ledger events per type; a transfer produces two rows
+EVENT_WEIGHTS = (('Deposit', 25), ('Transfer', 45), ('Debit Card Purchase', 30))
+
+BANKS = ['First National Bank', 'Riverside Savings', 'Metro Credit Union', 'Pioneer Trust']
+ACCOUNT_TYPES = ['Savings', 'Checking', 'Business', 'Student']
+OFFICERS = ['alicejohnson', 'bfo']
+
+# Collections written by generate(), plus state derived from the old data
+# (credentials, archive routing, reconciliation totals); dropped first when drop=True
+GENERATED_COLLECTIONS = ('customers', 'accounts', 'transactions', 'banks', 'category', 'statements', 'counters',
+                         'credentials', 'archives', 'ledger_totals', 'reconciliation', 'reconciliation_flags')
+
+
+def account_number(i):
+    return f'{i:010x}'
+
+
+def debit_card_number(i):
+    return f'{i:016x}'
+
+
+class _Writer:
+    # Buffers documents per collection and writes them in unordered insert_many batches
+    def __init__(self, db, batch_size):
+        self.db = db
+        self.batch_size = batch_size
+        self.buffers = {}
+        self.written = {}
+
+    def add(self, collection_name, document):
+        buffer = self.buffers.setdefault(collection_name, [])
+        buffer.append(document)
+        if len(buffer) >= self.batch_size:
+            self.flush(collection_name)
+
+    def flush(self, collection_name=None):
+        for name in [collection_name] if collection_name else list(self.buffers):
+            buffer = self.buffers.get(name)
+            if buffer:
+                self.db[name].insert_many(buffer, ordered=False)
+                self.written[name] = self.written.get(name, 0) + len(buffer)
+                buffer.clear()
+
+
+def _generate_partition(task):
+    # Runs in a worker process with its own client. Customers [first, last) are
+    # generated together with a ledger whose transfers stay inside the partition,
+    # so every account balance written here equals the sum of its ledger rows.
+    (uri, db_name, first, last, events, seed, start, days, password_hash,
+     bank_ids, category_ids, batch_size) = task
+    rng = random.Random(f'{seed}:{first}')
+    client = MongoClient(uri)
+    writer = _Writer(client[db_name], batch_size)
+    started = time.perf_counter()
+
+    customer_ids = {}
+    for i in range(first, last):
+        customer_ids[i] = ObjectId()
+        writer.add('customers', {
+            '_id': customer_ids[i], 'fname': f'First{i}', 'lname': f'Last{i}',
+            'dob': f'{rng.randint(1950, 2005)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+            'address': f'{i} Synthetic St', 'contact': f'555{i % 10_000_000:07d}', 'ssn': f'{i % 1_000_000_000:09d}',
+            'username': f'user{i}', 'password': password_hash, 'isActive': True,
+            'accountTypeId': rng.choice(category_ids)
+        })
+
+    # Events are spread evenly over the period in time order, so debits are only
+    # generated against money the account already holds
+    balances = dict.fromkeys(range(first, last), 0.0)
+    kinds = [kind for kind, _ in EVENT_WEIGHTS]
+    weights = [weight for _, weight in EVENT_WEIGHTS]
+    step = days * 86400 / max(events, 1)
+    for event in range(events):
+        when = start + timedelta(seconds=(event + rng.random()) * step)
+        when = when.replace(microsecond=when.microsecond // 1000 * 1000)  # BSON dates keep milliseconds
+        i = rng.randrange(first, last)
+        kind = rng.choices(kinds, weights)[0]
+        amount = round(rng.uniform(1, 500), 2)
+        if kind != 'Deposit' and balances[i] < amount:
+            kind = 'Deposit'
+            amount = round(rng.uniform(100, 2000), 2)
+
+        if kind == 'Deposit':
+            balances[i] += amount
+            writer.add('transactions', {'accountId': account_number(i),
+                                        'senderAccount': 'Bank Officer - ' + rng.choice(OFFICERS),
+                                        'amount': amount, 'type': 'Deposit', 'dateTime': when})
+        elif kind == 'Debit Card Purchase':
+            balances[i] -= amount
+            writer.add('transactions', {'accountId': account_number(i), 'receiverAccount': 'Online Ecommerce',
+                                        'amount': -amount, 'type': 'Debit Card Purchase', 'dateTime': when})
+        else:
+            receiver = rng.randrange(first, last)
+            if receiver == i:
+                receiver = first + (i - first + 1) % (last - first)
+            balances[i] -= amount
+            balances[receiver] += amount
+            writer.add('transactions', {'accountId': account_number(i), 'receiverAccount': account_number(receiver),
+                                        'amount': -amount, 'type': 'Transfer Debit', 'dateTime': when})
+            writer.add('transactions', {'accountId': account_number(receiver), 'senderAccount': account_number(i),
+                                        'amount': amount, 'type': 'Transfer Credit', 'dateTime': when})
+
+    # Accounts go in last, carrying the balance the ledger produced
+    for i in range(first, last):
+        writer.add('accounts', {'accountNumber': account_number(i), 'CustomerId': customer_ids[i],
+                                'balance': round(balances[i], 2), 'debitCard': debit_card_number(i),
+                                'bankId': bank_ids[i % len(bank_ids)]})
+    writer.flush()
+    client.close()
+    return writer.written, time.perf_counter() - started
+
+
+def generate(uri, db_name, customers, transactions, password_hash, workers=None, batch_size=BATCH_SIZE,
+             seed=0, days=730, drop=False, log=print):
+    # Build a synthetic adb dataset: `customers` customers with one account each and
+    # roughly `transactions` ledger rows over the last `days` days. Partitions of
+    # customers are generated in parallel; the caller builds indexes, counters and
+    # credentials afterwards, which is much faster than maintaining them during the load.
+    client = MongoClient(uri)
+    db = client[db_name]
+    if drop:
+        for name in GENERATED_COLLECTIONS:
+            db[name].drop()
+    elif db['customers'].estimated_document_count():
+        client.close()
+        raise ValueError(f'{db_name}.customers is not empty; use a scratch database or drop=True')
+
+    bank_ids = db['banks'].insert_many([{'name': name} for name in BANKS]).inserted_ids
+    category_ids = db['category'].insert_many([{'AccountType': name} for name in ACCOUNT_TYPES]).inserted_ids
+    client.close()
+
+    workers = workers or os.cpu_count() or 1
+    partitions = max(1, min(customers, workers * 4))
+    bounds = [customers * p // partitions for p in range(partitions + 1)]
+    # Each ledger event averages ~1.45 rows because transfers write both legs
+    rows_per_event = sum(weight * (2 if kind == 'Transfer' else 1) for kind, weight in EVENT_WEIGHTS) / \
+        sum(weight for _, weight in EVENT_WEIGHTS)
+    events = int(transactions / rows_per_event)
+    start = datetime.now().replace(microsecond=0) - timedelta(days=days)
+    tasks = [(uri, db_name, bounds[p], bounds[p + 1], events * (bounds[p + 1] - bounds[p]) // customers,
+              seed, start, days, password_hash, bank_ids, category_ids, batch_size)
+             for p in range(partitions) if bounds[p + 1] > bounds[p]]
+
+    totals = {}
+    started = time.perf_counter()
+    with process_pool(workers) as pool:
+        for done, (written, seconds) in enumerate(pool.imap_unordered(_generate_partition, tasks), start=1):
+            for name, count in written.items():
+                totals[name] = totals.get(name, 0) + count
+            log(f"partition {done}/{len(tasks)} in {seconds:.1f}s, "
+                f"{totals.get('transactions', 0)} transactions so far")
+    log(f"Generated {totals.get('customers', 0)} customers and {totals.get('transactions', 0)} transactions "
+        f"in {time.perf_counter() - started:.1f}s")
+    return totals
+
+
+def _dump_indexes(bson_path):
+    metadata_path = bson_path[:-len('.bson')] + '.metadata.json'
+    if not os.path.exists(metadata_path):
+        return []
+    with open(metadata_path) as metadata_file:
+        metadata = json.load(metadata_file)
+    indexes = []
+    for index in metadata.get('indexes', []):
+        if index.get('name') == '_id_':
+            continue
+        # mongodump writes extended JSON ({"$numberInt": "1"}) for the key directions
+        keys = [(field, int(direction['$numberInt']) if isinstance(direction, dict) else direction)
+                for field, direction in index['key'].items()]
+        indexes.append((keys, {option: value for option, value in index.items()
+                               if option in ('name', 'unique', 'sparse', 'expireAfterSeconds')}))
+    return indexes
+
+
+def restore_dump(db, path, batch_size=BATCH_SIZE, drop=False, log=print):
+    # Load mongodump output (a directory of <collection>.bson files or a single
+    # file) without mongorestore. Documents are decoded one at a time from the
+    # file and written in unordered insert_many batches; rows whose _id already
+    # exists are counted and skipped.
+    paths = [path] if os.path.isfile(path) else sorted(
+        os.path.join(path, name) for name in os.listdir(path) if name.endswith('.bson'))
+    restored = {}
+    for bson_path in paths:
+        name = os.path.basename(bson_path)[:-len('.bson')]
+        collection = db[name]
+        if drop:
+            collection.drop()
+        inserted = duplicates = 0
+
+        def write(batch):
+            nonlocal inserted, duplicates
+            try:
+                inserted += len(collection.insert_many(batch, ordered=False).inserted_ids)
+            except BulkWriteError as error:
+                errors = error.details['writeErrors']
+                existing = sum(1 for write_error in errors if write_error['code'] == 11000)
+                if existing < len(errors):
+                    raise
+                inserted += error.details['nInserted']
+                duplicates += existing
+
+        with open(bson_path, 'rb') as dump_file:
+            for batch in batches(bson.decode_file_iter(dump_file), batch_size):
+                write(batch)
+        for keys, options in _dump_indexes(bson_path):
+            collection.create_index(keys, **options)
+        restored[name] = inserted
+        log(f"{name}: {inserted} documents" + (f", {duplicates} already present" if duplicates else ''))
+    return restored
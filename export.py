@@ -0,0 +1,80 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+
+import archive
+
+# Ledger rows fetched per cursor batch and enriched per batched name lookup
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_FIELDS = ['_id', 'dateTime', 'accountId', 'accountName', 'type', 'amount', 'senderAccount', 'receiverAccount']
+
+
+def _account_names(db, account_numbers):
+    # Two $in queries per batch instead of two find_one calls per row
+    accounts = {account['accountNumber']: account.get('CustomerId') for account in
+                db['accounts'].find({'accountNumber': {'$in': list(account_numbers)}},
+                                    {'accountNumber': 1, 'CustomerId': 1})}
+    customers = {customer['_id']: f"{customer.get('fname', 'Unknown')} {customer.get('lname', '')}".strip()
+                 for customer in db['customers'].find({'_id': {'$in': list(set(accounts.values()))}},
+                                                      {'fname': 1, 'lname': 1})}
+    return {account_number: customers.get(customer_id, 'Unknown')
+            for account_number, customer_id in accounts.items()}
+
+
+def iter_ledger_batches(db, match, batch_size=EXPORT_BATCH_SIZE, start=None, end=None):
+    # Yields lists of at most batch_size enriched rows; only one batch is in memory at a time.
+    # Rows come from the hot set and every archived month overlapping [start, end).
+    batch = []
+    for transaction in archive.iter_rows(db, match, start=start, end=end, batch_size=batch_size):
+        batch.append(transaction)
+        if len(batch) >= batch_size:
+            yield _enrich(db, batch)
+            batch = []
+    if batch:
+        yield _enrich(db, batch)
+
+
+def _enrich(db, batch):
+    names = _account_names(db, {transaction['accountId'] for transaction in batch})
+    for transaction in batch:
+        transaction['accountName'] = names.get(transaction['accountId'], 'Unknown')
+    return batch
+
+
+def _value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value if value is None or isinstance(value, (int, float, str)) else str(value)
+
+
+def iter_export(db, match, file_format='csv', compress=False, batch_size=EXPORT_BATCH_SIZE, start=None, end=None):
+    # Produces the export as a stream of byte chunks, one per ledger batch
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31 writes a gzip container
+
+    def emit(text):
+        data = text.encode('utf-8')
+        return compressor.compress(data) if compressor else data
+
+    if file_format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_FIELDS)
+        yield emit(buffer.getvalue())
+
+    for batch in iter_ledger_batches(db, match, batch_size, start=start, end=end):
+        if file_format == 'csv':
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerows([_value(transaction.get(field)) for field in EXPORT_FIELDS] for transaction in batch)
+            chunk = emit(buffer.getvalue())
+        else:
+            chunk = emit(''.join(json.dumps({field: _value(transaction.get(field)) for field in EXPORT_FIELDS}) + '\n'
+                                 for transaction in batch))
+        if chunk:
+            yield chunk
+
+    if compressor:
+        yield compressor.flush()
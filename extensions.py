@@ -0,0 +1,118 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from bson import json_util
+from flask import current_app
+from flask_bcrypt import Bcrypt
+from pymongo import MongoClient
+
+from cache import ReadThroughCache, make_backend
+from instrumentation import CommandListener
+from ledger_writer import LedgerWriter
+
+bcrypt = Bcrypt()
+
+_lock = threading.Lock()
+
+
+def _process_state(app):
+    # MongoClient and thread pools are not fork-safe, so everything here is created
+    # lazily and rebuilt when the current PID differs from the one that created it
+    # (e.g. in each worker of a pre-fork server)
+    state = app.extensions.get('adb')
+    if state is None or state['pid'] != os.getpid():
+        with _lock:
+            state = app.extensions.get('adb')
+            if state is None or state['pid'] != os.getpid():
+                state = {'pid': os.getpid()}
+                app.extensions['adb'] = state
+    return state
+
+
+def _per_process(name, factory):
+    app = current_app._get_current_object()
+    state = _process_state(app)
+    if name not in state:
+        with _lock:
+            if name not in state:
+                state[name] = factory(app)
+    return state[name]
+
+
+def _write_concern(value):
+    return int(value) if isinstance(value, str) and value.isdigit() else value
+
+
+def _create_client(app):
+    options = {
+        'maxPoolSize': app.config['MONGO_MAX_POOL_SIZE'],
+        'minPoolSize': app.config['MONGO_MIN_POOL_SIZE'],
+        'waitQueueTimeoutMS': app.config['MONGO_TIMEOUT_MS'],
+        'serverSelectionTimeoutMS': app.config['MONGO_TIMEOUT_MS'],
+        'readPreference': app.config['MONGO_READ_PREFERENCE'],
+        'event_listeners': [CommandListener()],
+    }
+    if app.config['MONGO_WRITE_CONCERN'] is not None:
+        options['w'] = _write_concern(app.config['MONGO_WRITE_CONCERN'])
+    if app.config['MONGO_READ_CONCERN'] is not None:
+        options['readConcernLevel'] = app.config['MONGO_READ_CONCERN']
+    return MongoClient(app.config['MONGO_URI'], **options)
+
+
+def get_client():
+    return _per_process('client', _create_client)
+
+
+def get_db():
+    return get_client()[current_app.config['MONGO_DB']]
+
+
+def password_pool():
+    return _per_process('password_pool', lambda app: ThreadPoolExecutor(
+        max_workers=app.config['BCRYPT_WORKERS'], thread_name_prefix='bcrypt'))
+
+
+def payment_pool():
+    return _per_process('payment_pool', lambda app: ThreadPoolExecutor(
+        max_workers=app.config['PAYMENT_API_WORKERS'], thread_name_prefix='payments'))
+
+
+def ledger_writer():
+    # None unless LEDGER_GROUP_COMMIT is on, in which case ledger entries are inserted directly
+    if not current_app.config['LEDGER_GROUP_COMMIT']:
+        return None
+    # Resolved first: the factory runs under _lock, which get_client() takes too
+    collection = get_db()['transactions']
+    return _per_process('ledger_writer', lambda app: LedgerWriter(
+        collection, batch_size=app.config['LEDGER_BATCH_SIZE'], flush_ms=app.config['LEDGER_FLUSH_MS'],
+        queue_depth=app.config['LEDGER_QUEUE_DEPTH'], journal=app.config['LEDGER_JOURNAL']))
+
+
+def _create_caches(app):
+    # archive and counters read through these caches, so they are imported here rather than at the top
+    import archive
+    import counters
+
+    backend = make_backend(app.config['CACHE_BACKEND'])
+    return {
+        'account_name': ReadThroughCache('account_name', ttl=app.config['CACHE_TTL'],
+                                         max_entries=app.config['CACHE_MAX_ENTRIES'], backend=backend),
+        'reference': ReadThroughCache('reference', ttl=app.config['CACHE_TTL'], max_entries=16, backend=backend),
+        # Keyed by database name
+        'counters': ReadThroughCache('counters', ttl=counters.CACHE_TTL, max_entries=16, backend=backend),
+        'archive_state': ReadThroughCache('archive_state', ttl=archive.CACHE_TTL, max_entries=16, backend=backend,
+                                          codec=json_util),
+    }
+
+
+def caches():
+    return _per_process('caches', _create_caches)
+
+
+def hash_password(password):
+    return password_pool().submit(bcrypt.generate_password_hash, password).result().decode('utf-8')
+
+
+def check_password(password_hash, password):
+    return password_pool().submit(bcrypt.check_password_hash, password_hash, password).result()
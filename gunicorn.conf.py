@@ -0,0 +1,49 @@
+# gunicorn -c gunicorn.conf.py wsgi:app
+import glob
+import multiprocessing
+import os
+import tempfile
+
+bind = os.environ.get('ADB_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('ADB_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+# Threads per worker; bcrypt and the payment API already offload to bounded pools
+threads = int(os.environ.get('ADB_THREADS', 4))
+# The app is imported once in the master and forked into the workers
+preload_app = True
+# Workers combine their /metrics histograms through this directory, so a scrape
+# answered by any worker reports the whole server
+os.environ.setdefault('ADB_METRICS_DIR', os.path.join(tempfile.gettempdir(), 'adb-metrics'))
+
+
+def on_starting(server):
+    # Snapshots left by a previous run would be summed into this one's totals
+    for path in glob.glob(os.path.join(os.environ['ADB_METRICS_DIR'], '*.json')):
+        os.remove(path)
+
+
+def when_ready(server):
+    # Runs once in the master before any worker is forked
+    from pymongo.errors import PyMongoError
+
+    from main import prepare_database
+    from wsgi import app
+
+    try:
+        prepare_database(app)
+    except PyMongoError as error:
+        server.log.warning('Database preparation failed: %s', error)
+
+
+def post_fork(server, worker):
+    # The MongoClient and thread pools are created per process, so each worker
+    # opens its own connections here instead of on its first request
+    from pymongo.errors import PyMongoError
+
+    from main import warm_up
+    from wsgi import app
+
+    try:
+        warm_up(app)
+    except PyMongoError as error:
+        # Still serve; the pool is filled on demand once the server is reachable
+        server.log.warning('Worker %s warm-up failed: %s', worker.pid, error)
@@ -0,0 +1,131 @@
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+from customer_search import CASE_INSENSITIVE, SEARCH_FIELDS
+
+# Index manifest for the adb database, keyed by collection name.
+# Every hot lookup in the views must be backed by one of these.
+INDEXES = {
+    'accounts': [
+        IndexModel([('accountNumber', ASCENDING)], name='accountNumber_unique', unique=True),
+        IndexModel([('debitCard', ASCENDING)], name='debitCard_unique', unique=True),
+        IndexModel([('CustomerId', ASCENDING)], name='CustomerId'),
+    ],
+    'customers': [
+        IndexModel([('username', ASCENDING)], name='username_unique', unique=True),
+        IndexModel([('isActive', ASCENDING)], name='isActive'),
+        # Listing pages sort and prefix-search case-insensitively (see customer_search.py)
+        IndexModel([('username', ASCENDING), ('_id', ASCENDING)], name='username_id_ci', collation=CASE_INSENSITIVE),
+        IndexModel([('lname', ASCENDING), ('_id', ASCENDING)], name='lname_id_ci', collation=CASE_INSENSITIVE),
+        IndexModel([('fname', ASCENDING)], name='fname_ci', collation=CASE_INSENSITIVE),
+        IndexModel([('name', ASCENDING)], name='name_ci', collation=CASE_INSENSITIVE),
+        IndexModel([('contact', ASCENDING)], name='contact_ci', collation=CASE_INSENSITIVE),
+        IndexModel([('isActive', ASCENDING), ('username', ASCENDING), ('_id', ASCENDING)],
+                   name='isActive_username_id_ci', collation=CASE_INSENSITIVE),
+        IndexModel([('isActive', ASCENDING), ('lname', ASCENDING), ('_id', ASCENDING)],
+                   name='isActive_lname_id_ci', collation=CASE_INSENSITIVE),
+        IndexModel([('isActive', ASCENDING), ('_id', DESCENDING)], name='isActive_id'),
+    ],
+    'admin': [
+        IndexModel([('username', ASCENDING)], name='username_unique', unique=True),
+    ],
+    'bankofficer': [
+        IndexModel([('username', ASCENDING)], name='username_unique', unique=True),
+    ],
+    'credentials': [
+        # Usernames are unique across every role
+        IndexModel([('username', ASCENDING)], name='username_unique', unique=True),
+        IndexModel([('role', ASCENDING), ('userId', ASCENDING)], name='role_userId'),
+    ],
+    'authorizations': [
+        # Retried authorize calls find their authorization by the client's key
+        IndexModel([('idempotencyKey', ASCENDING)], name='idempotencyKey_unique', unique=True,
+                   partialFilterExpression={'idempotencyKey': {'$exists': True}}),
+        IndexModel([('status', ASCENDING), ('expiresAt', ASCENDING)], name='status_expiresAt'),
+    ],
+    'statements': [
+        IndexModel([('accountNumber', ASCENDING), ('period', DESCENDING)], name='accountNumber_period'),
+    ],
+    'transactions': [
+        # Ledger pages are sorted by (dateTime, _id) descending for keyset pagination
+        IndexModel([('dateTime', DESCENDING), ('_id', DESCENDING)], name='dateTime_id'),
+        IndexModel([('accountId', ASCENDING), ('dateTime', DESCENDING), ('_id', DESCENDING)],
+                   name='accountId_dateTime_id'),
+        IndexModel([('receiverAccount', ASCENDING), ('dateTime', DESCENDING), ('_id', DESCENDING)],
+                   name='receiverAccount_dateTime_id'),
+        IndexModel([('type', ASCENDING), ('dateTime', DESCENDING), ('_id', DESCENDING)],
+                   name='type_dateTime_id'),
+    ],
+}
+
+_CI = CASE_INSENSITIVE.document
+
+# Representative queries issued by each route, used to verify that none of them
+# falls back to a collection scan. Filter values are placeholders; only the shape matters.
+QUERY_PLANS = [
+    ('login', 'credentials', {'find': 'credentials', 'filter': {'username': 'sample'}}),
+    ('dashboard', 'customers', {'find': 'customers', 'filter': {'username': 'sample'}}),
+    ('approve_users', 'customers', {'find': 'customers', 'filter': {'isActive': False},
+                                    'sort': {'username': 1, '_id': 1}, 'limit': 51, 'collation': _CI}),
+    ('approve_users', 'customers', {'find': 'customers', 'filter': {'isActive': False},
+                                    'sort': {'_id': -1}, 'limit': 51, 'collation': _CI}),
+    ('manage_users', 'customers', {'find': 'customers', 'filter': {},
+                                   'sort': {'lname': 1, '_id': 1}, 'limit': 51, 'collation': _CI}),
+    ('manage_users', 'customers', {'find': 'customers', 'filter': {'$or': [
+        {field: {'$gte': 'sam', '$lt': 'sam\uffff'}} for field in SEARCH_FIELDS
+    ]}, 'sort': {'username': 1, '_id': 1}, 'limit': 51, 'collation': _CI}),
+    ('approve_user', 'accounts', {'find': 'accounts', 'filter': {'CustomerId': 'sample'}}),
+    ('dashboard', 'accounts', {'find': 'accounts', 'filter': {'CustomerId': 'sample'}}),
+    ('dashboard', 'transactions', {'find': 'transactions', 'filter': {'$or': [
+        {'accountId': 'sample'},
+        {'receiverAccount': 'sample', 'type': {'$ne': 'Transfer Debit'}}
+    ]}, 'sort': {'dateTime': -1, '_id': -1}, 'limit': 21}),
+    ('dashboard', 'statements', {'find': 'statements', 'filter': {
+        'accountNumber': 'sample', 'period': {'$gte': '2024-01-01', '$lte': '2024-01-31'}}, 'sort': {'period': 1}}),
+    ('statement', 'statements', {'find': 'statements', 'filter': {
+        'accountNumber': 'sample', 'period': {'$lte': '2024-01-31'}}, 'sort': {'period': -1}, 'limit': 1}),
+    ('transfer', 'accounts', {'find': 'accounts', 'filter': {'accountNumber': 'sample'}}),
+    ('deposit_money', 'accounts', {'find': 'accounts', 'filter': {'accountNumber': 'sample'}}),
+    ('process_payment', 'accounts', {'find': 'accounts', 'filter': {'debitCard': 'sample'}}),
+    ('api_authorize_payment', 'authorizations', {'find': 'authorizations', 'filter': {
+        'idempotencyKey': 'sample'}}),
+    ('api_capture_payment', 'authorizations', {'find': 'authorizations', 'filter': {
+        '_id': 'sample', 'status': 'authorized'}}),
+    ('get_account_name', 'accounts', {'find': 'accounts', 'filter': {'accountNumber': 'sample'}}),
+    ('view_transactions', 'transactions', {'aggregate': 'transactions', 'pipeline': [
+        {'$match': {}}, {'$sort': {'dateTime': -1, '_id': -1}}, {'$limit': 51}
+    ], 'cursor': {}}),
+    ('view_transactions', 'transactions', {'aggregate': 'transactions', 'pipeline': [
+        {'$match': {'accountId': 'sample'}}, {'$sort': {'dateTime': -1, '_id': -1}}, {'$limit': 51}
+    ], 'cursor': {}}),
+    ('view_transactions', 'transactions', {'aggregate': 'transactions', 'pipeline': [
+        {'$match': {'type': 'Deposit'}}, {'$sort': {'dateTime': -1, '_id': -1}}, {'$limit': 51}
+    ], 'cursor': {}}),
+]
+
+
+def ensure_indexes(db):
+    # create_indexes is a no-op for indexes that already exist with the same spec
+    created = {}
+    for collection_name, indexes in INDEXES.items():
+        created[collection_name] = db[collection_name].create_indexes(indexes)
+    return created
+
+
+def _has_collscan(plan):
+    if isinstance(plan, dict):
+        if plan.get('stage') == 'COLLSCAN':
+            return True
+        return any(_has_collscan(value) for value in plan.values())
+    if isinstance(plan, list):
+        return any(_has_collscan(value) for value in plan)
+    return False
+
+
+def check_query_plans(db):
+    # Returns (route, collection, command) for every query whose winning plan scans the collection
+    failures = []
+    for route, collection_name, command in QUERY_PLANS:
+        explain = db.command('explain', command, verbosity='queryPlanner')
+        if _has_collscan(explain):
+            failures.append((route, collection_name, command))
+    return failures
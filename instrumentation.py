@@ -0,0 +1,301 @@
+import glob
+import json
+import os
+import threading
+import time
+from contextvars import ContextVar
+from functools import partial
+
+from flask import Response, before_render_template, g, request, template_rendered
+from pymongo import monitoring
+
+# Commands issued while handling the current request; None outside a request
+_current = ContextVar('mongo_request_stats', default=None)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096)
+
+
+class RequestStats:
+    def __init__(self):
+        self.commands = []  # (command name, collection, duration seconds, documents returned)
+        self.render_seconds = 0.0
+
+    @property
+    def round_trips(self):
+        return len(self.commands)
+
+    @property
+    def mongo_seconds(self):
+        return sum(command[2] for command in self.commands)
+
+    @property
+    def documents(self):
+        return sum(command[3] for command in self.commands)
+
+
+def _documents_returned(reply):
+    cursor = reply.get('cursor')
+    if cursor:
+        return len(cursor.get('firstBatch', cursor.get('nextBatch', [])))
+    if 'value' in reply:  # findAndModify
+        return 1 if reply['value'] else 0
+    return 0
+
+
+class CommandListener(monitoring.CommandListener):
+    # Attributes every command to the request that issued it. Pass an instance to
+    # MongoClient(event_listeners=[...]).
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        stats = _current.get()
+        if stats is not None:
+            collection = event.command.get(event.command_name)
+            with self._lock:
+                self._pending[event.request_id] = (stats, event.command_name,
+                                                   collection if isinstance(collection, str) else None)
+
+    def _finish(self, event, reply):
+        with self._lock:
+            pending = self._pending.pop(event.request_id, None)
+        if pending:
+            stats, name, collection = pending
+            stats.commands.append((name, collection, event.duration_micros / 1e6, _documents_returned(reply)))
+
+    def succeeded(self, event):
+        self._finish(event, event.reply)
+
+    def failed(self, event):
+        self._finish(event, {})
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def snapshot(self):
+        with self._lock:
+            return {route: (list(counts), list(total)) for route, (counts, total) in self._series.items()}
+
+    def observe(self, route, value):
+        with self._lock:
+            counts, total = self._series.get(route, ([0] * len(self.buckets), [0, 0.0]))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            total[0] += 1
+            total[1] += value
+            self._series[route] = (counts, total)
+
+    def render(self, series=None):
+        # series defaults to this process's own samples; see merged_series for all workers
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for route, (counts, (count, value_sum)) in sorted((self.snapshot() if series is None else series).items()):
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{route="{route}",le="{bound}"}} {bucket_count}')
+            lines.append(f'{self.name}_bucket{{route="{route}",le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{route="{route}"}} {value_sum}')
+            lines.append(f'{self.name}_count{{route="{route}"}} {count}')
+        return lines
+
+
+HISTOGRAMS = {
+    'duration': Histogram('adb_request_duration_seconds', 'Request handling time', LATENCY_BUCKETS),
+    'mongo_seconds': Histogram('adb_request_mongo_seconds', 'Time spent waiting on MongoDB per request',
+                               LATENCY_BUCKETS),
+    'render_seconds': Histogram('adb_request_render_seconds', 'Template rendering time per request',
+                                LATENCY_BUCKETS),
+    'round_trips': Histogram('adb_request_mongo_round_trips', 'MongoDB commands per request', COUNT_BUCKETS),
+    'documents': Histogram('adb_request_mongo_documents', 'Documents returned by MongoDB per request',
+                           COUNT_BUCKETS),
+    # Ledger group commit (ledger_writer.py), labelled with the collection name
+    'ledger_batch_size': Histogram('adb_ledger_batch_entries', 'Ledger entries per group-commit insert',
+                                   BATCH_BUCKETS),
+    'ledger_flush_seconds': Histogram('adb_ledger_flush_seconds', 'insert_many time per group commit',
+                                      LATENCY_BUCKETS),
+    'ledger_queue_depth': Histogram('adb_ledger_queue_depth', 'Requests still queued when a flush starts',
+                                    BATCH_BUCKETS),
+    'ledger_wait_seconds': Histogram('adb_ledger_wait_seconds', 'Time a request waits for its ledger entries',
+                                     LATENCY_BUCKETS),
+}
+
+
+# Multi-process servers: every worker keeps its own HISTOGRAMS, so with METRICS_DIR
+# set each one writes a snapshot to <METRICS_DIR>/<pid>.json every few seconds and
+# /metrics sums all snapshots, whichever worker answers the scrape. Files of exited
+# workers are kept so totals never go backwards; the directory is cleared when the
+# server starts (gunicorn.conf.py).
+_snapshot_writer = {'pid': None}
+_snapshot_lock = threading.Lock()
+
+
+def write_snapshot(directory):
+    path = os.path.join(directory, f'{os.getpid()}.json')
+    with open(path + '.tmp', 'w') as snapshot_file:
+        json.dump({key: histogram.snapshot() for key, histogram in HISTOGRAMS.items()}, snapshot_file)
+    os.replace(path + '.tmp', path)
+
+
+def start_snapshot_writer(directory, interval):
+    # One writer thread per process, started again in each forked worker
+    if _snapshot_writer['pid'] == os.getpid():
+        return
+    with _snapshot_lock:
+        if _snapshot_writer['pid'] == os.getpid():
+            return
+        _snapshot_writer['pid'] = os.getpid()
+
+    def run():
+        while True:
+            time.sleep(interval)
+            write_snapshot(directory)
+
+    threading.Thread(target=run, name='metrics-snapshot', daemon=True).start()
+
+
+def merged_series(directory):
+    # Sum every worker's latest snapshot, with this worker's taken fresh
+    write_snapshot(directory)
+    merged = {key: {} for key in HISTOGRAMS}
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        try:
+            with open(path) as snapshot_file:
+                snapshot = json.load(snapshot_file)
+        except (OSError, ValueError):
+            continue  # removed or being replaced
+        for key, series in snapshot.items():
+            if key not in merged:
+                continue
+            for route, (counts, (count, value_sum)) in series.items():
+                current = merged[key].setdefault(route, ([0] * len(counts), [0, 0.0]))
+                for index, bucket_count in enumerate(counts):
+                    current[0][index] += bucket_count
+                current[1][0] += count
+                current[1][1] += value_sum
+    return merged
+
+
+def bind_current_context(func):
+    # Worker-pool threads don't inherit the request's context; wrap callables
+    # submitted to a pool so their commands are still attributed
+    stats = _current.get()
+
+    def run(*args, **kwargs):
+        token = _current.set(stats)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return run
+
+
+def _stream_with_stats(body, stats, finish):
+    # A streamed body (stream_template, Response(generator)) runs its queries and
+    # rendering after the view has returned and the request has been torn down.
+    # Each chunk is pulled with the request's stats bound, and the request is
+    # recorded once the server closes the body.
+    started = time.perf_counter()
+    mongo_before = stats.mongo_seconds
+    chunks = iter(body)
+    try:
+        while True:
+            token = _current.set(stats)
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                break
+            finally:
+                _current.reset(token)
+            yield chunk
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+        # Whatever the stream spent outside MongoDB was rendering
+        streamed = time.perf_counter() - started
+        stats.render_seconds += max(streamed - (stats.mongo_seconds - mongo_before), 0)
+        finish()
+
+
+def init_instrumentation(app):
+    # SLOW_REQUEST_MS / SLOW_REQUEST_MAX_QUERIES: log the full command sequence of
+    # requests slower than the threshold or issuing more queries than the limit
+    app.config.setdefault('SLOW_REQUEST_MS', 500)
+    app.config.setdefault('SLOW_REQUEST_MAX_QUERIES', 20)
+    metrics_dir = app.config.get('METRICS_DIR')
+    if metrics_dir:
+        os.makedirs(metrics_dir, exist_ok=True)
+
+    @app.before_request
+    def start_request_stats():
+        if metrics_dir:
+            start_snapshot_writer(metrics_dir, app.config['METRICS_SNAPSHOT_SECONDS'])
+        g.request_started = time.perf_counter()
+        g.request_stats = RequestStats()
+        g.request_stats_token = _current.set(g.request_stats)
+
+    def record(route, method, path, started, stats):
+        duration = time.perf_counter() - started
+        HISTOGRAMS['duration'].observe(route, duration)
+        HISTOGRAMS['mongo_seconds'].observe(route, stats.mongo_seconds)
+        HISTOGRAMS['render_seconds'].observe(route, stats.render_seconds)
+        HISTOGRAMS['round_trips'].observe(route, stats.round_trips)
+        HISTOGRAMS['documents'].observe(route, stats.documents)
+
+        if (duration * 1000 > app.config['SLOW_REQUEST_MS']
+                or stats.round_trips > app.config['SLOW_REQUEST_MAX_QUERIES']):
+            sequence = '\n'.join(f'  {name} {collection or ""} {seconds * 1000:.2f} ms, {documents} docs'
+                                 for name, collection, seconds, documents in stats.commands)
+            app.logger.warning('Slow request %s %s: %.1f ms, %d Mongo commands, %.1f ms rendering\n%s',
+                               method, path, duration * 1000, stats.round_trips, stats.render_seconds * 1000,
+                               sequence)
+
+    @app.after_request
+    def defer_streamed_stats(response):
+        # Streamed bodies are recorded when they finish instead of at teardown
+        stats = g.get('request_stats')
+        if stats is not None and response.is_streamed:
+            route = request.url_rule.endpoint if request.url_rule else 'unmatched'
+            finish = partial(record, route, request.method, request.path, g.request_started, stats)
+            response.response = _stream_with_stats(response.response, stats, finish)
+            g.request_stats_streamed = True
+        return response
+
+    @app.teardown_request
+    def finish_request_stats(error=None):
+        stats = g.pop('request_stats', None)
+        if stats is None:
+            return
+        _current.reset(g.pop('request_stats_token'))
+        started = g.pop('request_started')
+        route = request.url_rule.endpoint if request.url_rule else 'unmatched'
+        if g.pop('request_stats_streamed', False) or route == 'metrics':
+            return
+        record(route, request.method, request.path, started, stats)
+
+    def render_started(sender, template, context, **extra):
+        g.render_started = time.perf_counter()
+
+    def render_finished(sender, template, context, **extra):
+        started = g.pop('render_started', None)
+        stats = g.get('request_stats')
+        if started is not None and stats is not None:
+            stats.render_seconds += time.perf_counter() - started
+
+    before_render_template.connect(render_started, app, weak=False)
+    template_rendered.connect(render_finished, app, weak=False)
+
+    @app.route('/metrics')
+    def metrics():
+        merged = merged_series(metrics_dir) if metrics_dir else {}
+        lines = []
+        for key, histogram in HISTOGRAMS.items():
+            lines.extend(histogram.render(merged.get(key)))
+        return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
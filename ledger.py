@@ -0,0 +1,171 @@
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+# Number of transactions shown per account on the customer dashboard
+DASHBOARD_PAGE_SIZE = 20
+
+# Admin ledger view settings
+TRANSACTIONS_PAGE_SIZE = 50
+TRANSACTION_TYPES = ['Transfer Debit', 'Transfer Credit', 'Deposit', 'Debit Card Purchase']
+
+
+def format_transaction_datetime(value):
+    # Rows written before the datetime migration still hold strings
+    if isinstance(value, str):
+        value = datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+    # Format dateTime to 12-hour format
+    return value.strftime('%I:%M %p %d-%m-%Y')
+
+
+def parse_date_arg(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d") if value else None
+    except ValueError:
+        return None
+
+
+def encode_transaction_cursor(transaction):
+    date_time = transaction['dateTime']
+    if isinstance(date_time, datetime):
+        date_time = date_time.isoformat()
+    return f"{date_time}|{transaction['_id']}"
+
+
+def decode_transaction_cursor(cursor):
+    # Cursor is "<dateTime>|<_id>" of the last row on the previous page. Native
+    # dates are encoded in ISO format ("T" separator), legacy strings as stored.
+    try:
+        date_time, transaction_id = cursor.rsplit('|', 1)
+        if 'T' in date_time:
+            date_time = datetime.fromisoformat(date_time)
+        return date_time, ObjectId(transaction_id)
+    except (ValueError, TypeError, InvalidId):
+        return None
+
+
+class KeysetPage:
+    # Yields at most `limit` rows from an iterable fetched with limit + 1, so rows
+    # can be rendered straight off the cursor. next_cursor is set once the rows
+    # have been consumed, i.e. by the time a streamed template reaches the
+    # pagination links below the table.
+    def __init__(self, rows, limit, encode=None):
+        self._rows = rows
+        self.limit = limit
+        self.encode = encode or encode_transaction_cursor
+        self.count = 0
+        self.next_cursor = None
+
+    def __iter__(self):
+        last = None
+        for row in self._rows:
+            if self.count == self.limit:
+                self.next_cursor = self.encode(last)
+                break
+            self.count += 1
+            last = row
+            yield row
+        close = getattr(self._rows, 'close', None)
+        if close:
+            close()
+
+
+def transaction_cursor_clause(cursor):
+    # Keyset pagination: rows strictly after the cursor in (dateTime, _id) descending order
+    date_time, transaction_id = cursor
+    return {'$or': [
+        {'dateTime': {'$lt': date_time}},
+        {'dateTime': date_time, '_id': {'$lt': transaction_id}}
+    ]}
+
+
+def account_history_match(account_number, cursor=None):
+    # Rows where the account is the owner, plus rows naming it as receiver except
+    # the sender's debit leg of a transfer (the receiver already has its own credit)
+    clauses = [{'$or': [
+        {'accountId': account_number},
+        {'receiverAccount': account_number, 'type': {'$ne': 'Transfer Debit'}}
+    ]}]
+    if cursor:
+        clauses.append(transaction_cursor_clause(cursor))
+    return clauses[0] if len(clauses) == 1 else {'$and': clauses}
+
+
+def build_transaction_match(account_id=None, transaction_type=None, start_date=None, end_date=None, cursor=None):
+    clauses = []
+    if account_id:
+        clauses.append({'accountId': account_id})
+    if transaction_type:
+        clauses.append({'type': transaction_type})
+    if start_date:
+        clauses.append({'dateTime': {'$gte': start_date}})
+    if end_date:
+        # End date is inclusive, so compare against the start of the following day
+        clauses.append({'dateTime': {'$lt': end_date + timedelta(days=1)}})
+    if cursor:
+        clauses.append(transaction_cursor_clause(cursor))
+    if not clauses:
+        return {}
+    return clauses[0] if len(clauses) == 1 else {'$and': clauses}
+
+
+def transaction_ledger_pipeline(match, limit):
+    # Join each ledger row with its account holder on the server instead of
+    # issuing an accounts + customers lookup per transaction
+    return [
+        {'$match': match},
+        {'$sort': {'dateTime': -1, '_id': -1}},
+        {'$limit': limit},
+        {'$lookup': {
+            'from': 'accounts',
+            'localField': 'accountId',
+            'foreignField': 'accountNumber',
+            'as': 'account'
+        }},
+        {'$unwind': {'path': '$account', 'preserveNullAndEmptyArrays': True}},
+        {'$lookup': {
+            'from': 'customers',
+            'localField': 'account.CustomerId',
+            'foreignField': '_id',
+            'as': 'customer'
+        }},
+        {'$unwind': {'path': '$customer', 'preserveNullAndEmptyArrays': True}},
+        {'$project': {
+            'accountId': 1,
+            'type': 1,
+            'amount': 1,
+            'dateTime': 1,
+            # "fname lname", or just the first name when there is no last name
+            # ($cond rather than $trim, which mongomock does not implement)
+            'accountName': {'$cond': [
+                {'$gt': [{'$ifNull': ['$customer.lname', '']}, '']},
+                {'$concat': [{'$ifNull': ['$customer.fname', 'Unknown']}, ' ', '$customer.lname']},
+                {'$ifNull': ['$customer.fname', 'Unknown']}
+            ]}
+        }}
+    ]
+
+
+def transaction_filters(args):
+    return {
+        'account': args.get('account', '').strip(),
+        'type': args.get('type', '') if args.get('type') in TRANSACTION_TYPES else '',
+        'start_date': args.get('start_date', ''),
+        'end_date': args.get('end_date', '')
+    }
+
+
+def transaction_filters_match(filters, cursor=None):
+    return build_transaction_match(account_id=filters['account'],
+                                   transaction_type=filters['type'],
+                                   start_date=parse_date_arg(filters['start_date']),
+                                   end_date=parse_date_arg(filters['end_date']),
+                                   cursor=cursor)
+
+
+def transaction_filters_range(filters):
+    # [start, end) covered by the date filters, used to pick archive partitions
+    start_date = parse_date_arg(filters['start_date'])
+    end_date = parse_date_arg(filters['end_date'])
+    return start_date, (end_date + timedelta(days=1) if end_date else None)
@@ -0,0 +1,125 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from pymongo.errors import BulkWriteError
+from pymongo.write_concern import WriteConcern
+
+from instrumentation import HISTOGRAMS
+
+# Group commit for ledger inserts. Requests hand their entries to a LedgerWriter
+# and block on a future; one flusher thread per process drains the queue into a
+# single insert_many once batch_size entries are waiting or flush_ms after the
+# first of them arrived, then resolves each request's future with the outcome of
+# its own entries. A full queue blocks new requests instead of growing.
+
+LEDGER_BATCH_SIZE = 256
+LEDGER_FLUSH_MS = 2
+LEDGER_QUEUE_DEPTH = 4096
+
+_CLOSE = object()
+
+
+def insert_ledger_entries(db, entries, writer=None, session=None):
+    # Entries written inside a multi-document transaction must use its session,
+    # so they never go through the group commit
+    if writer is None or session is not None:
+        db['transactions'].insert_many(entries, session=session)
+    else:
+        writer.write(entries)
+
+
+class LedgerWriter:
+    def __init__(self, collection, batch_size=LEDGER_BATCH_SIZE, flush_ms=LEDGER_FLUSH_MS,
+                 queue_depth=LEDGER_QUEUE_DEPTH, journal=True):
+        if journal:
+            # A request is only answered once its batch is in the journal
+            collection = collection.with_options(
+                write_concern=WriteConcern(**{**collection.write_concern.document, 'j': True}))
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_seconds = flush_ms / 1000
+        self.flushes = 0
+        self.entries_written = 0
+        self._queue = queue.Queue(maxsize=queue_depth)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='ledger-writer', daemon=True)
+        self._thread.start()
+
+    def write(self, entries, timeout=None):
+        # Blocks until the batch holding these entries is acknowledged; raises the
+        # driver error when any of them failed. Like insert_many, sets each _id.
+        future = Future()
+        started = time.perf_counter()
+        try:
+            self._queue.put((entries, future), timeout=timeout)
+            return future.result(timeout)
+        finally:
+            HISTOGRAMS['ledger_wait_seconds'].observe(self.collection.name, time.perf_counter() - started)
+
+    def close(self):
+        # Flush what is queued and stop the flusher thread
+        self._queue.put(_CLOSE)
+        self._thread.join()
+
+    def _collect(self):
+        # Wait for a first request, then gather more until the batch is full or the
+        # window closes; whatever is already queued is always taken
+        batch = [self._queue.get()]
+        if batch[0] is _CLOSE:
+            self._closed = True
+            return []
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.flush_seconds
+        while size < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _CLOSE:
+                self._closed = True
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    def _flush(self, batch):
+        documents = [entry for entries, _ in batch for entry in entries]
+        HISTOGRAMS['ledger_queue_depth'].observe(self.collection.name, self._queue.qsize())
+        started = time.perf_counter()
+        failed = set()
+        error = None
+        try:
+            # Unordered, so one bad entry doesn't hold back the other requests' rows
+            self.collection.insert_many(documents, ordered=False)
+        except BulkWriteError as bulk_error:
+            error = bulk_error
+            if bulk_error.details.get('writeConcernErrors'):
+                # Durability unknown for the whole batch
+                failed = set(range(len(documents)))
+            else:
+                failed = {write_error['index'] for write_error in bulk_error.details.get('writeErrors', [])}
+        except Exception as flush_error:
+            # Anything else fails every request in the batch; the flusher carries on
+            error = flush_error
+            failed = set(range(len(documents)))
+        HISTOGRAMS['ledger_flush_seconds'].observe(self.collection.name, time.perf_counter() - started)
+        HISTOGRAMS['ledger_batch_size'].observe(self.collection.name, len(documents))
+        self.flushes += 1
+        self.entries_written += len(documents) - len(failed)
+
+        offset = 0
+        for entries, future in batch:
+            if failed.intersection(range(offset, offset + len(entries))):
+                future.set_exception(error)
+            else:
+                future.set_result(None)
+            offset += len(entries)
+
+    def _run(self):
+        while not self._closed:
+            batch = self._collect()
+            if batch:
+                self._flush(batch)
@@ -0,0 +1,42 @@
+from extensions import caches, get_db
+
+
+def load_account_name(account_number):
+    db = get_db()
+    account = db['accounts'].find_one({'accountNumber': account_number}, {'CustomerId': 1})
+    if account:
+        customer = db['customers'].find_one({'_id': account['CustomerId']}, {'fname': 1, 'name': 1})
+        if customer:
+            return customer.get('fname') or customer.get('name') or ''
+    return ''
+
+
+def account_name(account_number):
+    # Called on every blur of the transfer form, so answer from the cache when possible
+    return caches()['account_name'].get(account_number, lambda: load_account_name(account_number))
+
+
+def list_banks():
+    return caches()['reference'].get('banks', lambda: [{'_id': str(bank['_id']), 'name': bank.get('name')}
+                                                       for bank in get_db()['banks'].find({}, {'name': 1})])
+
+
+def list_account_types():
+    return caches()['reference'].get('categories', lambda: [
+        {'id': str(category['_id']), 'type': category['AccountType']}
+        for category in get_db()['category'].find({}, {'AccountType': 1})])
+
+
+def invalidate_account_names(*account_numbers):
+    caches()['account_name'].invalidate(*account_numbers)
+
+
+def invalidate_customer_accounts(customer_id):
+    # Account names are cached by account number, so drop every account of the customer
+    account_numbers = [account['accountNumber'] for account in
+                       get_db()['accounts'].find({'CustomerId': customer_id}, {'accountNumber': 1})]
+    invalidate_account_names(*account_numbers)
+
+
+def cache_stats():
+    return {name: cache.stats() for name, cache in caches().items()}
@@ -0,0 +1,41 @@
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+LEGACY_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def migrate_transaction_datetimes(db, batch_size=1000, log=print):
+    # Convert string dateTime values to native BSON dates, a batch of the
+    # remaining string rows at a time in _id order. Converted rows drop out of
+    # the query, so an interrupted run simply resumes, rows restored later (even
+    # with older _ids) are picked up by the next run, and once everything is
+    # converted a run is a single empty query on the dateTime_id index. Each batch
+    # is a short unordered bulk write so the collection is never locked for the
+    # whole migration.
+    checkpoints = db['migrations']
+    converted = 0
+    last_id = None
+
+    while True:
+        # Within a run, never revisit a row that failed to convert
+        query = {'dateTime': {'$type': 'string'}}
+        if last_id:
+            query['_id'] = {'$gt': last_id}
+        batch = list(db['transactions'].find(query, {'dateTime': 1}).sort('_id', 1).limit(batch_size))
+        if not batch:
+            break
+
+        requests = [
+            UpdateOne({'_id': transaction['_id'], 'dateTime': transaction['dateTime']},
+                      {'$set': {'dateTime': datetime.strptime(transaction['dateTime'], LEGACY_DATETIME_FORMAT)}})
+            for transaction in batch
+        ]
+        converted += db['transactions'].bulk_write(requests, ordered=False).modified_count
+        last_id = batch[-1]['_id']
+        log(f"Converted {converted} transactions (up to {last_id})")
+
+    checkpoints.update_one({'_id': 'transaction_datetimes'},
+                           {'$inc': {'converted': converted}, '$set': {'completedAt': datetime.now()},
+                            '$unset': {'lastId': ''}}, upsert=True)
+    return converted
@@ -0,0 +1,21 @@
+import multiprocessing
+
+# Helpers shared by the bulk jobs (datagen, reconcile, batch ingestion)
+
+
+def process_pool(workers):
+    # spawn rather than fork: the children must not inherit the parent's client
+    # sockets, so each task opens its own MongoClient from a URI
+    return multiprocessing.get_context('spawn').Pool(workers)
+
+
+def batches(items, size):
+    # Lists of up to `size` consecutive items, so a stream is never held in memory at once
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,156 @@
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from counters import record_transactions
+from ledger_writer import insert_ledger_entries
+from statements import record_statement_entry
+from transfers import available_at_least, parse_amount
+
+# Structured error codes returned by the payment API, with their HTTP status
+INVALID_REQUEST = 'invalid_request'
+INSUFFICIENT_FUNDS = 'insufficient_funds'
+AUTHORIZATION_NOT_FOUND = 'authorization_not_found'
+ACCOUNT_NOT_FOUND = 'account_not_found'
+TIMEOUT = 'timeout'
+
+ERROR_STATUS = {
+    INVALID_REQUEST: 400,
+    INSUFFICIENT_FUNDS: 402,
+    AUTHORIZATION_NOT_FOUND: 404,
+    ACCOUNT_NOT_FOUND: 404,
+    TIMEOUT: 504,
+}
+
+
+# Holds not captured or voided by then are released by expire_authorizations.
+# A hold placed after its API call timed out is voided straight away unless the
+# client sent an Idempotency-Key, so this only covers clients that never return.
+AUTHORIZATION_TTL = timedelta(days=7)
+
+
+class PaymentError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+def _authorization_result(authorization):
+    return {'authorizationId': str(authorization['_id']), 'status': authorization['status'],
+            'amount': authorization['amount']}
+
+
+def authorize(db, debit_card_number, amount, merchant='Online Ecommerce', idempotency_key=None):
+    # Place a hold: the available balance (balance - heldBalance) must cover the
+    # amount. The balance itself only moves on capture, so the ledger stays in step.
+    # A client retrying with the same idempotency_key (e.g. after a timeout) gets
+    # the authorization that was already placed instead of a second hold.
+    amount = parse_amount(amount)
+    if not debit_card_number or amount is None:
+        raise PaymentError(INVALID_REQUEST, 'A debit card number and a positive amount are required')
+    if idempotency_key:
+        existing = db['authorizations'].find_one({'idempotencyKey': idempotency_key})
+        if existing:
+            return _authorization_result(existing)
+
+    account = db['accounts'].find_one_and_update(
+        {'debitCard': debit_card_number, **available_at_least(amount)},
+        {'$inc': {'heldBalance': amount}},
+        projection={'accountNumber': 1}
+    )
+    if account is None:
+        raise PaymentError(INSUFFICIENT_FUNDS, 'Insufficient funds or invalid card number')
+
+    now = datetime.now()
+    authorization = {
+        'accountNumber': account['accountNumber'],
+        'amount': amount,
+        'merchant': merchant,
+        'status': 'authorized',
+        'createdAt': now,
+        'expiresAt': now + AUTHORIZATION_TTL
+    }
+    if idempotency_key:
+        authorization['idempotencyKey'] = idempotency_key
+    try:
+        db['authorizations'].insert_one(authorization)
+    except DuplicateKeyError:
+        # A concurrent retry with the same key won; release this hold and return its authorization
+        db['accounts'].update_one({'accountNumber': account['accountNumber']}, {'$inc': {'heldBalance': -amount}})
+        return _authorization_result(db['authorizations'].find_one({'idempotencyKey': idempotency_key}))
+    return _authorization_result(authorization)
+
+
+def _claim_authorization(db, authorization_id, status):
+    # Moving out of "authorized" is a single conditional update, so a capture,
+    # void or expiry can only ever win once. Expired holds can no longer be captured.
+    try:
+        authorization_id = ObjectId(authorization_id)
+    except (InvalidId, TypeError):
+        raise PaymentError(INVALID_REQUEST, 'Malformed authorization id')
+    now = datetime.now()
+    query = {'_id': authorization_id, 'status': 'authorized'}
+    if status == 'captured':
+        query['expiresAt'] = {'$not': {'$lte': now}}
+    authorization = db['authorizations'].find_one_and_update(query, {'$set': {'status': status, 'updatedAt': now}})
+    if authorization is None:
+        raise PaymentError(AUTHORIZATION_NOT_FOUND, 'No open authorization with this id')
+    return authorization
+
+
+def capture(db, authorization_id, writer=None):
+    authorization = _claim_authorization(db, authorization_id, 'captured')
+    amount = authorization['amount']
+    account = db['accounts'].find_one_and_update(
+        {'accountNumber': authorization['accountNumber']},
+        {'$inc': {'balance': -amount, 'heldBalance': -amount}},
+        projection={'balance': 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if account is None:
+        # Account deleted since the hold was placed: nothing was charged, so reopen the authorization
+        db['authorizations'].update_one({'_id': authorization['_id'], 'status': 'captured'},
+                                        {'$set': {'status': 'authorized', 'updatedAt': datetime.now()}})
+        raise PaymentError(ACCOUNT_NOT_FOUND, 'The account of this authorization no longer exists')
+
+    # Record the transaction
+    entry = {
+        "accountId": authorization['accountNumber'],
+        "receiverAccount": authorization['merchant'],
+        "amount": -amount,
+        "type": "Debit Card Purchase",
+        "dateTime": datetime.now(),
+        "authorizationId": authorization['_id']
+    }
+    insert_ledger_entries(db, [entry], writer=writer)
+    record_transactions(db, [entry])
+    record_statement_entry(db, authorization['accountNumber'], -amount, account['balance'], entry['dateTime'])
+    return {'authorizationId': str(authorization['_id']), 'status': 'captured', 'amount': amount}
+
+
+def void(db, authorization_id):
+    authorization = _claim_authorization(db, authorization_id, 'voided')
+    db['accounts'].update_one({'accountNumber': authorization['accountNumber']},
+                              {'$inc': {'heldBalance': -authorization['amount']}})
+    return {'authorizationId': str(authorization['_id']), 'status': 'voided', 'amount': authorization['amount']}
+
+
+def expire_authorizations(db, now=None):
+    # Release the holds of authorizations past expiresAt, e.g. those whose client
+    # never received the id because the API call timed out
+    now = now or datetime.now()
+    expired = 0
+    for authorization in db['authorizations'].find({'status': 'authorized', 'expiresAt': {'$lte': now}},
+                                                   {'_id': 1}):
+        try:
+            authorization = _claim_authorization(db, authorization['_id'], 'expired')
+        except PaymentError:
+            continue  # captured or voided in the meantime
+        db['accounts'].update_one({'accountNumber': authorization['accountNumber']},
+                                  {'$inc': {'heldBalance': -authorization['amount']}})
+        expired += 1
+    return expired
@@ -0,0 +1,279 @@
+import csv
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+from pymongo import DeleteMany, InsertOne, MongoClient, ReplaceOne, UpdateOne
+
+import archive
+from parallel import batches, process_pool
+
+# Balance reconciliation: every account balance must equal the sum of its ledger
+# rows. Per-account ledger sums are kept in `ledger_totals`
+#   {_id: accountNumber, total, rows, asOf: watermark ObjectId}
+# so an incremental run only replays the rows added since the previous one.
+# The reconciliation document (_id 'balances') holds
+#   watermark  every ledger row with a smaller _id is included in ledger_totals
+#   run        {mode, engine, from, to, bounds, done} while a run is in progress
+# and accounts flagged by the current run are kept in `reconciliation_flags`.
+
+STATE_ID = 'balances'
+
+# Differences up to this amount are float noise, not discrepancies
+TOLERANCE = 0.005
+# Rows newer than this are left to the next run, so inserts still in flight
+# (whose _id can be older than rows already visible) are not skipped
+WATERMARK_LAG = timedelta(seconds=60)
+# Rows per NumPy chunk, and accounts per comparison query
+BATCH_SIZE = 50000
+COMPARE_BATCH_SIZE = 1000
+
+ENGINES = ('server', 'numpy')
+REPORT_FIELDS = ['accountNumber', 'balance', 'ledgerTotal', 'difference', 'rows']
+
+
+def partition_bounds(db, partitions):
+    # Equal-sized accountNumber ranges from $bucketAuto. Account numbers are random
+    # hex, so the ranges spread the ledger as evenly as hashing would while each
+    # partition stays a single range scan of the accountId index. The outer ranges
+    # are open so ledger rows of deleted accounts are covered too.
+    buckets = list(db['accounts'].aggregate([
+        {'$bucketAuto': {'groupBy': '$accountNumber', 'buckets': partitions}}
+    ], allowDiskUse=True))
+    starts = [bucket['_id']['min'] for bucket in buckets[1:]]
+    return list(zip([None] + starts, starts + [None]))
+
+
+def _range(field, low, high):
+    condition = {}
+    if low is not None:
+        condition['$gte'] = low
+    if high is not None:
+        condition['$lt'] = high
+    return {field: condition} if condition else {}
+
+
+def _merge(totals, more):
+    for account, (total, rows) in more.items():
+        current = totals.setdefault(account, [0, 0])
+        current[0] += total
+        current[1] += rows
+
+
+def _server_totals(collection, match):
+    # One $group per source; only the per-account sums cross the wire
+    return {row['_id']: [row['total'], row['rows']] for row in collection.aggregate([
+        {'$match': match},
+        {'$group': {'_id': '$accountId', 'total': {'$sum': '$amount'}, 'rows': {'$sum': 1}}}
+    ], allowDiskUse=True)}
+
+
+def _row_totals(rows):
+    totals = {}
+    for row in rows:
+        current = totals.setdefault(row['accountId'], [0, 0])
+        current[0] += row.get('amount') or 0
+        current[1] += 1
+    return totals
+
+
+def _numpy_totals(rows, batch_size=BATCH_SIZE):
+    # Replay (accountId, amount) pairs in chunks: accounts get dense codes and each
+    # chunk is summed with a single bincount
+    import numpy
+
+    codes = {}
+    chunk_codes, chunk_amounts = [], []
+    totals = numpy.zeros(0)
+    counts = numpy.zeros(0, dtype=numpy.int64)
+
+    def flush():
+        nonlocal totals, counts
+        size = len(codes)
+        code_array = numpy.array(chunk_codes, dtype=numpy.int64)
+        amount_array = numpy.array(chunk_amounts, dtype=numpy.float64)
+        totals = numpy.pad(totals, (0, size - len(totals))) + numpy.bincount(code_array, amount_array, size)
+        counts = numpy.pad(counts, (0, size - len(counts))) + numpy.bincount(code_array, minlength=size)
+        chunk_codes.clear()
+        chunk_amounts.clear()
+
+    for row in rows:
+        chunk_codes.append(codes.setdefault(row['accountId'], len(codes)))
+        chunk_amounts.append(row.get('amount') or 0)
+        if len(chunk_codes) >= batch_size:
+            flush()
+    if chunk_codes:
+        flush()
+    return {account: [float(totals[code]), int(counts[code])] for account, code in codes.items()}
+
+
+def _ledger_totals(db, engine, match, sources, state, batch_size):
+    totals = {}
+    for kind, name, _ in sources:
+        # Rows of a month still being deleted from the hot set are already summed
+        # from its archive collection
+        source_match = archive.hot_match(state, match) if kind == 'hot' else match
+        if kind == 'file':
+            rows = archive.iter_file_rows(name, source_match)
+        elif engine == 'numpy':
+            rows = db[name].find(source_match, {'accountId': 1, 'amount': 1, '_id': 0}).batch_size(batch_size)
+        else:
+            _merge(totals, _server_totals(db[name], source_match))
+            continue
+        _merge(totals, _numpy_totals(rows, batch_size) if engine == 'numpy' else _row_totals(rows))
+    return totals
+
+
+def _store_full(db, low, high, totals, watermark):
+    # Replacing the whole range keeps a rerun of an interrupted partition exact
+    requests = [DeleteMany(_range('_id', low, high))]
+    requests += [InsertOne({'_id': account, 'total': total, 'rows': rows, 'asOf': watermark})
+                 for account, (total, rows) in totals.items()]
+    db['ledger_totals'].bulk_write(requests, ordered=True)
+
+
+def _store_increment(db, totals, watermark_from, watermark_to):
+    # Create the missing totals, then add each delta only to totals not yet moved
+    # to the new watermark, so retrying a partition can't count a row twice
+    if not totals:
+        return
+    db['ledger_totals'].bulk_write([
+        UpdateOne({'_id': account}, {'$setOnInsert': {'total': 0, 'rows': 0, 'asOf': watermark_from}}, upsert=True)
+        for account in totals
+    ], ordered=False)
+    db['ledger_totals'].bulk_write([
+        UpdateOne({'_id': account, 'asOf': {'$lt': watermark_to}},
+                  {'$inc': {'total': total, 'rows': rows}, '$set': {'asOf': watermark_to}})
+        for account, (total, rows) in totals.items()
+    ], ordered=False)
+
+
+def _discrepancy(account_number, balance, total):
+    ledger = round(total.get('total', 0), 2)
+    return {'_id': account_number, 'accountNumber': account_number, 'balance': balance, 'ledgerTotal': ledger,
+            'difference': None if balance is None else round(balance - ledger, 2), 'rows': total.get('rows', 0)}
+
+
+def _compare(db, low, high, tolerance):
+    # Accounts against their totals, then totals whose account no longer exists,
+    # each in batches joined with one $in query
+    flagged = []
+    accounts = 0
+    cursor = db['accounts'].find(_range('accountNumber', low, high), {'accountNumber': 1, 'balance': 1, '_id': 0})
+    for batch in batches(cursor, COMPARE_BATCH_SIZE):
+        accounts += len(batch)
+        totals = {row['_id']: row for row in db['ledger_totals'].find(
+            {'_id': {'$in': [account['accountNumber'] for account in batch]}})}
+        for account in batch:
+            total = totals.get(account['accountNumber'], {})
+            if abs(account.get('balance', 0) - total.get('total', 0)) > tolerance:
+                flagged.append(_discrepancy(account['accountNumber'], account.get('balance', 0), total))
+
+    for batch in batches(db['ledger_totals'].find(_range('_id', low, high)), COMPARE_BATCH_SIZE):
+        existing = {account['accountNumber'] for account in db['accounts'].find(
+            {'accountNumber': {'$in': [total['_id'] for total in batch]}}, {'accountNumber': 1, '_id': 0})}
+        flagged.extend(_discrepancy(total['_id'], None, total) for total in batch
+                       if total['_id'] not in existing and abs(total['total']) > tolerance)
+    return accounts, flagged
+
+
+def _reconcile_partition(task):
+    # Runs in a worker process with its own client
+    uri, db_name, index, low, high, run, tolerance, batch_size = task
+    started = time.perf_counter()
+    client = MongoClient(uri)
+    db = client[db_name]
+    match = _range('accountId', low, high)
+    state = archive.get_state(db, fresh=True)
+    if run['mode'] == 'full':
+        # Every source, hot and archived, up to the new watermark
+        match['_id'] = {'$lt': run['to']}
+        totals = _ledger_totals(db, run['engine'], match, archive.ledger_sources(db), state, batch_size)
+        _store_full(db, low, high, totals, run['to'])
+    else:
+        # New rows only ever land in the hot collection
+        match['_id'] = {'$gte': run['from'], '$lt': run['to']}
+        totals = _ledger_totals(db, run['engine'], match, [('hot', 'transactions', None)], state, batch_size)
+        _store_increment(db, totals, run['from'], run['to'])
+
+    accounts, flagged = _compare(db, low, high, tolerance)
+    if flagged:
+        db['reconciliation_flags'].bulk_write([ReplaceOne({'_id': row['_id']}, row, upsert=True)
+                                               for row in flagged], ordered=False)
+    client.close()
+    rows = sum(count for _, count in totals.values())
+    return index, accounts, rows, len(flagged), time.perf_counter() - started
+
+
+def _recheck(db, watermark, tolerance):
+    # Balances are read after the watermark was fixed, so activity since then looks
+    # like drift. Add each flagged account's newer rows and read its balance again.
+    confirmed = []
+    for flag in db['reconciliation_flags'].find().sort('_id', 1):
+        account = db['accounts'].find_one({'accountNumber': flag['accountNumber']}, {'balance': 1})
+        newer = next(db['transactions'].aggregate([
+            {'$match': {'accountId': flag['accountNumber'], '_id': {'$gte': watermark}}},
+            {'$group': {'_id': None, 'total': {'$sum': '$amount'}, 'rows': {'$sum': 1}}}
+        ]), {'total': 0, 'rows': 0})
+        total = {'total': flag['ledgerTotal'] + newer['total'], 'rows': flag['rows'] + newer['rows']}
+        balance = account.get('balance', 0) if account else None
+        if balance is None or abs(balance - total['total']) > tolerance:
+            confirmed.append(_discrepancy(flag['accountNumber'], balance, total))
+    return confirmed
+
+
+def write_report(path, discrepancies):
+    with open(path, 'w', newline='') as report_file:
+        writer = csv.DictWriter(report_file, REPORT_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(discrepancies)
+
+
+def reconcile(uri, db_name, mode='full', engine='server', partitions=None, workers=None, tolerance=TOLERANCE,
+              batch_size=BATCH_SIZE, log=print):
+    # Compare every balance with its ledger sum, one accountNumber range per task on
+    # a process pool. mode='incremental' replays only the rows added since the last
+    # run on top of ledger_totals, falling back to a full run when there is none.
+    # An interrupted run resumes with the same ranges and watermarks.
+    client = MongoClient(uri)
+    db = client[db_name]
+    state = db['reconciliation'].find_one({'_id': STATE_ID}) or {}
+    workers = workers or os.cpu_count() or 1
+
+    run = state.get('run')
+    if run:
+        log(f"Resuming {run['mode']} run, {len(run['done'])}/{len(run['bounds'])} partitions done")
+    else:
+        if mode == 'incremental' and not state.get('watermark'):
+            log('No previous run, reconciling in full')
+            mode = 'full'
+        run = {'mode': mode, 'engine': engine, 'from': state.get('watermark'),
+               'to': ObjectId.from_datetime(datetime.now(timezone.utc) - WATERMARK_LAG),
+               'bounds': [list(bound) for bound in partition_bounds(db, partitions or workers * 4)], 'done': []}
+        db['reconciliation_flags'].delete_many({})
+        db['reconciliation'].update_one({'_id': STATE_ID}, {'$set': {'run': run}}, upsert=True)
+
+    tasks = [(uri, db_name, index, low, high, run, tolerance, batch_size)
+             for index, (low, high) in enumerate(run['bounds']) if index not in run['done']]
+    accounts = rows = 0
+    started = time.perf_counter()
+    with process_pool(max(1, min(workers, len(tasks)))) as pool:
+        for index, partition_accounts, partition_rows, flagged, seconds in pool.imap_unordered(
+                _reconcile_partition, tasks):
+            accounts += partition_accounts
+            rows += partition_rows
+            db['reconciliation'].update_one({'_id': STATE_ID}, {'$addToSet': {'run.done': index}})
+            log(f"partition {index}: {partition_accounts} accounts, {partition_rows} rows, "
+                f"{flagged} flagged in {seconds:.1f}s")
+
+    discrepancies = _recheck(db, run['to'], tolerance)
+    summary = {'mode': run['mode'], 'engine': run['engine'], 'accounts': accounts, 'rows': rows,
+               'discrepancies': len(discrepancies), 'seconds': round(time.perf_counter() - started, 1),
+               'finishedAt': datetime.now()}
+    db['reconciliation'].update_one({'_id': STATE_ID}, {'$set': {'watermark': run['to'], 'lastRun': summary},
+                                                        '$unset': {'run': ''}})
+    client.close()
+    log(f"{accounts} accounts and {rows} ledger rows checked, {len(discrepancies)} discrepancies "
+        f"in {summary['seconds']}s")
+    return summary, discrepancies
@@ -0,0 +1,150 @@
+import heapq
+
+from pymongo import ReplaceOne, UpdateOne
+
+import archive
+
+# Daily statement snapshots, one document per account per day with activity:
+#   {_id: "<accountNumber>:<YYYY-MM-DD>", accountNumber, period: "YYYY-MM-DD",
+#    openingBalance, debitTotal, creditTotal, debitCount, creditCount}
+# The closing balance is openingBalance + creditTotal + debitTotal (debits are negative).
+
+
+def _statement_update(account_number, amount, balance_after, when, count=1):
+    # The first write of the day fixes the opening balance; later writes only add
+    # to the totals. Concurrent first writes on the same account and day can skew
+    # the opening balance; rebuild_statements restores it from the ledger.
+    period = when.strftime('%Y-%m-%d')
+    side = 'credit' if amount >= 0 else 'debit'
+    return ({'_id': f'{account_number}:{period}'},
+            {'$setOnInsert': {'accountNumber': account_number, 'period': period,
+                              'openingBalance': balance_after - amount},
+             '$inc': {f'{side}Total': amount, f'{side}Count': count}})
+
+
+def record_statement_entry(db, account_number, amount, balance_after, when, session=None):
+    # Called by every ledger write with the account balance it produced
+    query, update = _statement_update(account_number, amount, balance_after, when)
+    db['statements'].update_one(query, update, upsert=True, session=session)
+
+
+def record_statement_entries(db, entries, session=None):
+    # Bulk form for batch ingestion: (account_number, amount, balance_after, when, count) tuples
+    if entries:
+        db['statements'].bulk_write([UpdateOne(*_statement_update(*entry), upsert=True) for entry in entries],
+                                    ordered=False, session=session)
+
+
+def closing_balance(snapshot):
+    return snapshot['openingBalance'] + snapshot.get('creditTotal', 0) + snapshot.get('debitTotal', 0)
+
+
+def balance_on(db, account_number, day):
+    # Closing balance of the last day with activity on or before `day`, in one indexed query
+    snapshot = db['statements'].find_one({'accountNumber': account_number, 'period': {'$lte': day}},
+                                         sort=[('period', -1)])
+    return closing_balance(snapshot) if snapshot else 0
+
+
+def monthly_statement(db, account_number, month):
+    # Roll the daily snapshots of one month (YYYY-MM) up into a statement
+    days = list(db['statements'].find({'accountNumber': account_number,
+                                       'period': {'$gte': f'{month}-01', '$lte': f'{month}-31'}}).sort('period', 1))
+    if not days:
+        opening = balance_on(db, account_number, f'{month}-00')
+        return {'month': month, 'openingBalance': opening, 'closingBalance': opening,
+                'creditTotal': 0, 'debitTotal': 0, 'creditCount': 0, 'debitCount': 0, 'days': []}
+
+    statement = {'month': month, 'openingBalance': days[0]['openingBalance'], 'closingBalance': closing_balance(days[-1]),
+                 'days': days}
+    for field in ('creditTotal', 'debitTotal', 'creditCount', 'debitCount'):
+        statement[field] = sum(day.get(field, 0) for day in days)
+    return statement
+
+
+def _day_expression():
+    # Legacy rows still hold "%Y-%m-%d %H:%M:%S" strings
+    return {'$cond': [{'$eq': [{'$type': '$dateTime'}, 'string']},
+                      {'$substrBytes': ['$dateTime', 0, 10]},
+                      {'$dateToString': {'format': '%Y-%m-%d', 'date': '$dateTime'}}]}
+
+
+def _source_days(db, state, kind, name, account_number):
+    # Per-(account, day) totals of one ledger source, sorted by account then day.
+    # Rows without a string accountId can't have a statement and would not sort
+    # against the others.
+    if kind == 'file':
+        days = {}
+        for row in archive.iter_file_rows(name, {'accountId': account_number} if account_number else {}):
+            if not isinstance(row.get('accountId'), str):
+                continue
+            when = row['dateTime']
+            period = when[:10] if isinstance(when, str) else when.strftime('%Y-%m-%d')
+            day = days.setdefault((row['accountId'], period), {
+                '_id': {'account': row['accountId'], 'period': period},
+                'creditTotal': 0, 'debitTotal': 0, 'creditCount': 0, 'debitCount': 0})
+            side = 'credit' if row['amount'] >= 0 else 'debit'
+            day[f'{side}Total'] += row['amount']
+            day[f'{side}Count'] += 1
+        return [days[key] for key in sorted(days)]
+
+    match = {'accountId': account_number if account_number else {'$type': 'string'}}
+    source_match = archive.hot_match(state, match) if kind == 'hot' else match
+    return db[name].aggregate([
+        {'$match': source_match},
+        {'$group': {
+            '_id': {'account': '$accountId', 'period': _day_expression()},
+            'creditTotal': {'$sum': {'$cond': [{'$gte': ['$amount', 0]}, '$amount', 0]}},
+            'debitTotal': {'$sum': {'$cond': [{'$lt': ['$amount', 0]}, '$amount', 0]}},
+            'creditCount': {'$sum': {'$cond': [{'$gte': ['$amount', 0]}, 1, 0]}},
+            'debitCount': {'$sum': {'$cond': [{'$lt': ['$amount', 0]}, 1, 0]}}
+        }},
+        {'$sort': {'_id.account': 1, '_id.period': 1}}
+    ], allowDiskUse=True)
+
+
+def rebuild_statements(db, account_number=None, batch_size=1000):
+    # Recompute snapshots from the ledger, archived and offloaded months included.
+    # Daily totals are grouped per source (on the server for collections) and the
+    # sorted streams merged; months are disjoint, so no day spans two sources.
+    # Opening balances are replayed backwards from each account's current balance
+    # so accounts with history older than the ledger still come out right.
+    state = archive.get_state(db, fresh=True)
+    rows = heapq.merge(*[_source_days(db, state, kind, name, account_number)
+                         for kind, name, _ in archive.ledger_sources(db)],
+                       key=lambda row: (row['_id']['account'], row['_id']['period']))
+
+    written = 0
+    requests = []
+
+    def flush_account(account, days):
+        account_doc = db['accounts'].find_one({'accountNumber': account}, {'balance': 1})
+        if account_doc is None:
+            return
+        balance = account_doc['balance'] - sum(day['creditTotal'] + day['debitTotal'] for day in days)
+        for day in days:
+            period = day['_id']['period']
+            requests.append(ReplaceOne({'_id': f'{account}:{period}'}, {
+                'accountNumber': account, 'period': period, 'openingBalance': balance,
+                'creditTotal': day['creditTotal'], 'debitTotal': day['debitTotal'],
+                'creditCount': day['creditCount'], 'debitCount': day['debitCount']
+            }, upsert=True))
+            balance += day['creditTotal'] + day['debitTotal']
+
+    current_account, days = None, []
+    for row in rows:
+        if row['_id']['account'] != current_account:
+            if days:
+                flush_account(current_account, days)
+            current_account, days = row['_id']['account'], []
+        days.append(row)
+        if len(requests) >= batch_size:
+            written += len(requests)
+            db['statements'].bulk_write(requests, ordered=False)
+            requests.clear()
+    if days:
+        flush_account(current_account, days)
+    if requests:
+        written += len(requests)
+        db['statements'].bulk_write(requests, ordered=False)
+    return written
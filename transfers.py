@@ -0,0 +1,164 @@
+import math
+from datetime import datetime
+
+from pymongo import ReturnDocument
+
+from counters import record_transactions
+from ledger_writer import insert_ledger_entries
+from statements import record_statement_entry
+
+# Results of execute_transfer
+COMPLETED = 'completed'
+DUPLICATE = 'duplicate'
+INSUFFICIENT_FUNDS = 'insufficient_funds'
+INVALID_AMOUNT = 'invalid_amount'
+RECEIVER_NOT_FOUND = 'receiver_not_found'
+
+# How many recent idempotency keys each sender account remembers. Retries of a
+# transfer arrive within seconds, so a short window is enough to dedupe them.
+IDEMPOTENCY_WINDOW = 50
+
+
+def parse_amount(value):
+    # A positive, finite amount, or None. float() accepts 'nan' and 'inf', which get
+    # past a plain `> 0` check and would poison balances through $inc.
+    try:
+        amount = float(value)
+    except (TypeError, ValueError):
+        return None
+    return amount if math.isfinite(amount) and amount > 0 else None
+
+
+def available_at_least(amount):
+    # Balance minus card authorizations still on hold (see payments.py) covers amount
+    return {'$expr': {'$gte': [{'$subtract': ['$balance', {'$ifNull': ['$heldBalance', 0]}]}, amount]}}
+
+
+def _apply_transfer(db, sender_account_number, receiver_account_number, amount, idempotency_key, session=None,
+                    writer=None):
+    accounts = db['accounts']
+
+    # Balance check, debit and idempotency check in a single conditional update:
+    # concurrent transfers can no longer overdraw the account, and a retried key
+    # does not match because it is already in recentTransferKeys
+    sender = accounts.find_one_and_update(
+        {'accountNumber': sender_account_number,
+         'recentTransferKeys': {'$ne': idempotency_key},
+         **available_at_least(amount)},
+        {'$inc': {'balance': -amount},
+         '$push': {'recentTransferKeys': {'$each': [idempotency_key], '$slice': -IDEMPOTENCY_WINDOW}}},
+        projection={'balance': 1},
+        return_document=ReturnDocument.AFTER,
+        session=session
+    )
+    if sender is None:
+        # Only the failure path pays for a second read to tell the two cases apart
+        seen = accounts.find_one({'accountNumber': sender_account_number, 'recentTransferKeys': idempotency_key},
+                                 {'_id': 1}, session=session)
+        return DUPLICATE if seen else INSUFFICIENT_FUNDS
+
+    receiver = accounts.find_one_and_update({'accountNumber': receiver_account_number},
+                                            {'$inc': {'balance': amount}}, projection={'balance': 1},
+                                            return_document=ReturnDocument.AFTER, session=session)
+    if receiver is None:
+        # Give the money back rather than letting it disappear
+        accounts.update_one({'accountNumber': sender_account_number},
+                            {'$inc': {'balance': amount}, '$pull': {'recentTransferKeys': idempotency_key}},
+                            session=session)
+        return RECEIVER_NOT_FOUND
+
+    # Both ledger legs go to the server in one insert_many (or one group commit)
+    now = datetime.now()
+    entries = [
+        {
+            "accountId": sender_account_number,
+            "receiverAccount": receiver_account_number,
+            "amount": -round(amount, 2),  # Negative amount for debit
+            "type": "Transfer Debit",
+            "dateTime": now,
+            "idempotencyKey": idempotency_key
+        },
+        {
+            "accountId": receiver_account_number,
+            "senderAccount": sender_account_number,
+            "amount": round(amount, 2),
+            "type": "Transfer Credit",
+            "dateTime": now,
+            "idempotencyKey": idempotency_key
+        }
+    ]
+    insert_ledger_entries(db, entries, writer=writer, session=session)
+    record_transactions(db, entries, session=session)
+    record_statement_entry(db, sender_account_number, -amount, sender['balance'], now, session=session)
+    record_statement_entry(db, receiver_account_number, amount, receiver['balance'], now, session=session)
+    return COMPLETED
+
+
+def execute_transfer(client, db, sender_account_number, receiver_account_number, amount, idempotency_key,
+                     use_transaction=False, writer=None):
+    # With use_transaction (replica set or sharded cluster required) the debit,
+    # credit and ledger legs commit or roll back together. On a standalone server
+    # the same steps run one after another, with a compensating refund when the
+    # receiver does not exist. writer (a LedgerWriter) is only used outside transactions.
+    amount = parse_amount(amount)
+    if amount is None:
+        return INVALID_AMOUNT
+    if not use_transaction:
+        return _apply_transfer(db, sender_account_number, receiver_account_number, amount, idempotency_key,
+                               writer=writer)
+
+    with client.start_session() as session:
+        return session.with_transaction(
+            lambda s: _apply_transfer(db, sender_account_number, receiver_account_number, amount,
+                                      idempotency_key, session=s))
+
+
+def deposit(db, account_number, amount, officer_username, writer=None):
+    # Atomic $inc instead of read-modify-write, so concurrent deposits are never lost
+    account = db['accounts'].find_one_and_update(
+        {'accountNumber': account_number},
+        {'$inc': {'balance': amount}},
+        projection={'balance': 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if account is None:
+        return None
+
+    # Record the deposit transaction
+    entry = {
+        "accountId": account_number,
+        "senderAccount": "Bank Officer - " + officer_username,  # Identifies the bank officer
+        "amount": round(amount, 2),
+        "type": "Deposit",
+        "dateTime": datetime.now()
+    }
+    insert_ledger_entries(db, [entry], writer=writer)
+    record_transactions(db, [entry])
+    record_statement_entry(db, account_number, amount, account['balance'], entry['dateTime'])
+    return account['balance']
+
+
+def card_payment(db, debit_card_number, amount, writer=None):
+    # Balance check and debit in one conditional update: concurrent purchases on
+    # the same card can neither lose an update nor overdraw the account
+    account = db['accounts'].find_one_and_update(
+        {'debitCard': debit_card_number, **available_at_least(amount)},
+        {'$inc': {'balance': -amount}},
+        projection={'accountNumber': 1, 'balance': 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if account is None:
+        return None
+
+    # Record the transaction
+    entry = {
+        "accountId": account['accountNumber'],
+        "receiverAccount": "Online Ecommerce",
+        "amount": -amount,
+        "type": "Debit Card Purchase",
+        "dateTime": datetime.now()
+    }
+    insert_ledger_entries(db, [entry], writer=writer)
+    record_transactions(db, [entry])
+    record_statement_entry(db, account['accountNumber'], -amount, account['balance'], entry['dateTime'])
+    return account['balance']
@@ -0,0 +1,2 @@
+# Route blueprints. Each module exposes ``bp``; create_app registers the ones
+# listed in the BLUEPRINTS config setting.
@@ -0,0 +1,318 @@
+from bson import ObjectId
+from flask import (Blueprint, Response, current_app, flash, jsonify, redirect, render_template, request, session,
+                   stream_template, stream_with_context, url_for)
+from pymongo.errors import DuplicateKeyError
+
+import archive
+import batch
+import customer_search
+from counters import get_counters, increment
+from credentials import delete_credential, save_credential, set_credential_fields
+from customer_search import SORT_LABELS, USERS_PAGE_SIZE, decode_cursor, encode_cursor, listing_args
+from export import iter_export
+from extensions import get_client, get_db, hash_password, ledger_writer
+from ledger import (TRANSACTION_TYPES, TRANSACTIONS_PAGE_SIZE, KeysetPage, decode_transaction_cursor,
+                    transaction_filters, transaction_filters_match, transaction_filters_range,
+                    transaction_ledger_pipeline)
+from lookups import cache_stats as lookup_cache_stats
+from lookups import invalidate_customer_accounts, list_account_types, list_banks
+from transfers import deposit, parse_amount
+
+bp = Blueprint('admin', __name__)
+
+
+@bp.route('/approve_users')
+def approve_users():
+    if 'username' in session and session['user_type'] == 'admin':
+        username = session['username']
+        listing = listing_args(request.args)
+        cursor = decode_cursor(request.args.get('after', ''))
+        unapproved_users = KeysetPage(customer_search.find_page(get_db(), {'isActive': False}, listing['q'],
+                                                                listing['sort'], cursor),
+                                      USERS_PAGE_SIZE, encode=lambda row: encode_cursor(listing['sort'], row))
+        return stream_template('approve_users.html', users=unapproved_users, username=username, listing=listing,
+                               sort_options=SORT_LABELS, is_first_page=cursor is None)
+    else:
+        return redirect(url_for('auth.login'))
+
+@bp.route('/approve_user/<user_id>', methods=['GET', 'POST'])
+def approve_user(user_id):
+    if 'username' in session and session['user_type'] == 'admin':
+        db = get_db()
+        username = session['username']
+        user = db['customers'].find_one({'_id': ObjectId(user_id)})
+
+        if request.method == 'POST':
+            category_id = request.form.get('account_type')
+            db['customers'].update_one({'_id': ObjectId(user_id)}, {'$set': {'isActive': True, 'accountTypeId': ObjectId(category_id)}})
+            set_credential_fields(db, 'customer', ObjectId(user_id), {'isActive': True})
+            invalidate_customer_accounts(ObjectId(user_id))
+            return redirect(url_for('admin.approve_users'))
+
+        # Account types and banks come from the reference cache
+        account_types = list_account_types()
+        account = db['accounts'].find_one({'CustomerId': ObjectId(user_id)})
+        bank = next((bank for bank in list_banks() if bank['_id'] == str(account['bankId'])), None)
+        return render_template('approve_user.html', user=user, account_types=account_types, username=username, bank=bank)
+    else:
+        return redirect(url_for('auth.login'))
+
+@bp.route('/deposit_money', methods=['GET', 'POST'])
+def deposit_money():
+    if 'username' in session and session['user_type'] == 'admin':
+        username=session['username']
+        if request.method == 'POST':
+            account_number = request.form.get('account_number')
+            deposit_amount = parse_amount(request.form.get('deposit_amount'))
+
+            if deposit_amount is None:
+                flash('Invalid amount', 'error')
+            elif deposit(get_db(), account_number, deposit_amount, session['username'],
+                         writer=ledger_writer()) is not None:
+                flash('Deposit successful', 'success')
+            else:
+                flash('Account not found', 'error')
+
+            return redirect(url_for('admin.deposit_money'))
+
+        return render_template('deposit_money.html',username=username)
+    else:
+        return redirect(url_for('auth.login'))
+
+
+@bp.route('/batch_upload', methods=['GET', 'POST'])
+def batch_upload():
+    if 'username' in session and session['user_type'] == 'admin':
+        username = session['username']
+        report = None
+        if request.method == 'POST':
+            uploaded = request.files.get('batch_file')
+            if not uploaded or not uploaded.filename:
+                flash('Choose a file to upload', 'error')
+                return redirect(url_for('admin.batch_upload'))
+
+            kind = batch.TRANSFER if request.form.get('kind') == batch.TRANSFER else batch.DEPOSIT
+            file_format = 'ndjson' if uploaded.filename.lower().endswith(('.ndjson', '.jsonl')) else 'csv'
+            # The upload is read row by row from Werkzeug's spooled temp file
+            report = batch.ingest(get_client(), get_db(), uploaded.stream, kind, file_format=file_format,
+                                  officer_username=username,
+                                  use_transaction=current_app.config['MONGO_TRANSACTIONS'])
+
+        return render_template('batch_upload.html', username=username, report=report)
+    else:
+        return redirect(url_for('auth.login'))
+
+
+@bp.route('/admin_dashboard')
+def admin_dashboard():
+    if 'username' in session and session['user_type'] == 'admin':
+        # Maintained incrementally by the write paths, see counters.py
+        counters = get_counters(get_db())
+        total_users = counters.get('customers', 0)
+        bank_officers = counters.get('bankofficers', 0)
+        total_transactions = counters.get('transactions', 0)
+
+        return render_template('admin_dashboard.html',
+                               username=session['username'],
+                               total_users=total_users,
+                               bank_officers=bank_officers,
+                               total_transactions=total_transactions,
+                               transaction_types=counters.get('types', {}))
+    else:
+        return redirect(url_for('auth.login'))
+
+@bp.route('/bankofficer_dashboard')
+def bankofficer_dashboard():
+    if 'username' in session and session['user_type'] == 'admin':
+        # Maintained incrementally by the write paths, see counters.py
+        counters = get_counters(get_db())
+        total_users = counters.get('customers', 0)
+        bank_officers = counters.get('bankofficers', 0)
+        total_transactions = counters.get('transactions', 0)
+
+        return render_template('bankofficer_dashboard.html',
+                               username=session['username'],
+                               total_users=total_users,
+                               bank_officers=bank_officers,
+                               total_transactions=total_transactions)
+    else:
+        return redirect(url_for('auth.login'))
+
+
+@bp.route('/cache_stats')
+def cache_stats():
+    if 'username' in session and session.get('user_type') == 'admin':
+        return jsonify(lookup_cache_stats())
+    else:
+        return redirect(url_for('auth.login'))
+
+
+@bp.route('/manage_users')
+def manage_users():
+    if 'username' in session and session['user_type'] == 'admin':
+        username = session['username']
+        # One bounded, projected query per page, streamed straight from the cursor
+        listing = listing_args(request.args)
+        cursor = decode_cursor(request.args.get('after', ''))
+        users = KeysetPage(customer_search.find_page(get_db(), {}, listing['q'], listing['sort'], cursor),
+                           USERS_PAGE_SIZE, encode=lambda row: encode_cursor(listing['sort'], row))
+        return stream_template('manage_users.html', users=users, username=username, listing=listing,
+                               sort_options=SORT_LABELS, is_first_page=cursor is None)
+    else:
+        return redirect(url_for('auth.login'))
+
+
+@bp.route('/edit_user/<user_id>', methods=['GET', 'POST'])
+def edit_user(user_id):
+    if 'username' not in session or session['user_type'] != 'admin':
+        return redirect(url_for('auth.login'))
+
+    db = get_db()
+    user = db['customers'].find_one({'_id': ObjectId(user_id)})
+    if not user:
+        return 'User not found'
+
+    if request.method == 'POST':
+        # Extract data from the form
+        updated_fname = request.form.get('fname')
+        updated_lname = request.form.get('lname')
+        updated_dob = request.form.get('dob')
+        updated_address = request.form.get('address')
+        updated_contact = request.form.get('contact')
+        updated_ssn = request.form.get('ssn')
+        updated_username = request.form.get('username')
+
+        # The credential's unique username also guards against clashes with admins
+        # and bank officers, so it is renamed first
+        try:
+            if updated_username != user['username']:
+                set_credential_fields(db, 'customer', user['_id'], {'username': updated_username})
+            # Update user information in the database
+            db['customers'].update_one(
+                {'_id': ObjectId(user_id)},
+                {'$set': {
+                    'fname': updated_fname,
+                    'lname': updated_lname,
+                    'dob': updated_dob,
+                    'address': updated_address,
+                    'contact': updated_contact,
+                    'ssn': updated_ssn,
+                    'username': updated_username,
+                    # Add more fields as needed
+                }}
+            )
+        except DuplicateKeyError:
+            if updated_username != user['username']:
+                set_credential_fields(db, 'customer', user['_id'], {'username': user['username']})
+            flash('Username already exists', 'error')
+            return redirect(url_for('admin.edit_user', user_id=user_id))
+        invalidate_customer_accounts(user['_id'])
+
+        return redirect(url_for('admin.manage_users'))
+
+    return render_template('edit_user.html', user=user)
+
+
+
+@bp.route('/delete_user/<user_id>', methods=['GET'])
+def delete_user(user_id):
+    if 'username' in session and session['user_type'] == 'admin':
+        db = get_db()
+        invalidate_customer_accounts(ObjectId(user_id))
+        if db['customers'].delete_one({'_id': ObjectId(user_id)}).deleted_count:
+            increment(db, {'customers': -1})
+        delete_credential(db, 'customer', ObjectId(user_id))
+        return redirect(url_for('admin.manage_users'))
+    else:
+        return redirect(url_for('auth.login'))
+
+
+@bp.route('/view_transactions')
+def view_transactions():
+    if 'username' in session and session['user_type'] == 'admin':
+        username = session['username']
+
+        filters = transaction_filters(request.args)
+        cursor = decode_transaction_cursor(request.args.get('after', ''))
+        match = transaction_filters_match(filters, cursor=cursor)
+
+        # Fetch one extra row to know whether there is a next page. Only the
+        # partitions overlapping the date filters are queried.
+        start, end = transaction_filters_range(filters)
+        transactions = KeysetPage(archive.iter_page(get_db(), match, TRANSACTIONS_PAGE_SIZE + 1,
+                                                    transaction_ledger_pipeline, start=start, end=end),
+                                  TRANSACTIONS_PAGE_SIZE)
+        # Rows are rendered as they arrive from the cursor; the header goes out first
+        return stream_template('view_transactions.html', transactions=transactions, username=username,
+                               filters=filters, transaction_types=TRANSACTION_TYPES, is_first_page=cursor is None)
+    else:
+        return redirect(url_for('auth.login'))
+
+
+
+@bp.route('/export_transactions')
+def export_transactions():
+    if 'username' in session and session['user_type'] == 'admin':
+        file_format = 'ndjson' if request.args.get('format') == 'ndjson' else 'csv'
+        compress = request.args.get('gzip') == '1'
+        filters = transaction_filters(request.args)
+        match = transaction_filters_match(filters)
+        start, end = transaction_filters_range(filters)
+
+        filename = f"transactions.{file_format}" + ('.gz' if compress else '')
+        mimetype = 'application/gzip' if compress else ('text/csv' if file_format == 'csv' else 'application/x-ndjson')
+        # Rows are produced batch by batch while the client downloads
+        return Response(stream_with_context(iter_export(get_db(), match, file_format=file_format, compress=compress,
+                                                        start=start, end=end)),
+                        mimetype=mimetype, headers={'Content-Disposition': f'attachment; filename={filename}'})
+    else:
+        return redirect(url_for('auth.login'))
+
+
+@bp.route('/add-user', methods=['GET'])
+def add_user():
+    if 'username' in session and session['user_type'] == 'admin':
+        username = session['username']
+        return render_template('add_user.html', username=username)
+    else:
+        return redirect(url_for('auth.login'))
+
+
+@bp.route('/create-user', methods=['POST'])
+def create_user():
+    if 'username' in session and session['user_type'] == 'admin':
+        db = get_db()
+        username = request.form['username']
+        name = request.form.get('name')  # Add a name field in your form for bank officers
+        password = request.form['password']
+        role = request.form['role']
+        hashed_password = hash_password(password)
+        if role not in ('bankofficer', 'admin'):
+            return redirect(url_for('admin.add_user'))
+
+        user_id = ObjectId()
+        try:
+            save_credential(db, username, hashed_password, role, user_id)
+        except DuplicateKeyError:
+            flash('Username already exists', 'error')
+            return redirect(url_for('admin.add_user'))
+
+        increment(db, {'bankofficers' if role == 'bankofficer' else 'admins': 1})
+        if role == 'bankofficer':
+            db['bankofficer'].insert_one({
+                "_id": user_id,
+                "name": name,
+                "username": username,
+                "password": hashed_password,
+                "deposit": True  # Assuming all bank officers have deposit rights
+            })
+        elif role == 'admin':
+            db['admin'].insert_one({
+                "_id": user_id,
+                "username": username,
+                "password": hashed_password
+            })
+
+        return redirect(url_for('admin.admin_dashboard'))
+    else:
+        return redirect(url_for('auth.login'))
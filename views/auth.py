@@ -0,0 +1,132 @@
+import secrets
+
+from bson import ObjectId
+from flask import Blueprint, current_app, flash, redirect, render_template, request, session, url_for
+from pymongo.errors import DuplicateKeyError
+
+from counters import increment
+from credentials import hash_rounds, save_credential, update_password_hash
+from extensions import bcrypt, check_password, get_db, hash_password
+from lookups import invalidate_account_names, list_banks
+
+bp = Blueprint('auth', __name__)
+
+
+class User:
+    def __init__(self, username, password):
+        self.username = username
+        self.password = bcrypt.generate_password_hash(password).decode('utf-8')
+
+
+@bp.route('/')
+def home():
+    return redirect(url_for('auth.login'))
+
+
+@bp.route('/register', methods=['GET', 'POST'])
+def register():
+    if request.method == 'POST':
+        db = get_db()
+        fname = request.form.get('fname')
+        lname = request.form.get('lname')
+        dob = request.form.get('dob')
+        address = request.form.get('address')
+        contact = request.form.get('contact')
+        ssn = request.form.get('ssn')
+        username = request.form.get('username')
+        password = request.form.get('password')
+        cpassword = request.form.get('cpassword')
+        bank_id = request.form.get('bank_id')
+
+        # Check if passwords match
+        if password != cpassword:
+            flash('Password and Confirm Password do not match', 'error')
+            return redirect(url_for('auth.register'))
+
+        # Hash the password
+        hashed_password = hash_password(password)
+
+        user = {
+            "_id": ObjectId(),
+            "fname": fname,
+            "lname": lname,
+            "dob": dob,
+            "address": address,
+            "contact": contact,
+            "ssn": ssn,
+            "username": username,
+            "password": hashed_password,
+            "isActive": False  # You can set this to True if you want to activate the account immediately
+        }
+
+        # The credential's unique username also guards against clashes with admins and bank officers
+        try:
+            save_credential(db, username, hashed_password, 'customer', user['_id'], is_active=False)
+        except DuplicateKeyError:
+            flash('Username already exists', 'error')
+            return redirect(url_for('auth.register'))
+
+        user_inserted = db['customers'].insert_one(user)
+        increment(db, {'customers': 1})
+
+        # Generate a random account number and debit card number
+        account_number = secrets.token_hex(5)  # Adjust length as needed
+        debit_card_number = secrets.token_hex(8)  # Adjust length as needed
+
+        # Create an account for the user
+        account = {
+            "accountNumber": account_number,
+            "CustomerId": user_inserted.inserted_id,  # MongoDB generated ID
+            "balance": 0,
+            "debitCard": debit_card_number,
+            "bankId": ObjectId(bank_id)
+        }
+
+        # Assuming 'accounts' is your account collection
+        db['accounts'].insert_one(account)
+        # A lookup of this number before it existed may have cached an empty name
+        invalidate_account_names(account_number)
+
+        flash('Registration successful', 'success')
+        return redirect(url_for('auth.login'))
+
+    return render_template('register.html', banks=list_banks())
+
+
+@bp.route('/login', methods=['GET', 'POST'])
+def login():
+    if request.method == 'POST':
+        db = get_db()
+        username = request.form.get('username')
+        password = request.form.get('password')
+
+        # One indexed lookup resolves the user and their role
+        credential = db['credentials'].find_one({'username': username})
+        if credential and check_password(credential['password'], password):
+            if hash_rounds(credential['password']) != current_app.config['BCRYPT_LOG_ROUNDS']:
+                # Transparently move the stored hash to the configured cost
+                update_password_hash(db, credential, hash_password(password))
+
+            if credential['role'] == 'customer':
+                if credential.get('isActive', False):  # Check if user is approved
+                    session['username'] = username
+                    return redirect(url_for('customer.dashboard'))
+                else:
+                    flash('Account not yet approved by admin', 'error')
+                    return redirect(url_for('auth.login'))
+
+            session['username'] = username
+            session['user_type'] = 'admin'  # Admins and bank officers share the 'admin' user type
+            if credential['role'] == 'bankofficer':
+                return redirect(url_for('admin.bankofficer_dashboard'))
+            return redirect(url_for('admin.admin_dashboard'))
+
+        flash('Invalid username or password', 'error')  # Flash message for invalid login
+
+    return render_template('login.html')
+
+
+@bp.route('/logout')
+def logout():
+    session.pop('username', None)
+    return redirect(url_for('auth.login'))
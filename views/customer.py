@@ -0,0 +1,175 @@
+import secrets
+from datetime import datetime
+
+from flask import (Blueprint, current_app, flash, redirect, render_template, request, session, stream_template,
+                   url_for)
+
+import transfers
+from extensions import get_client, get_db, ledger_writer
+from ledger import DASHBOARD_PAGE_SIZE, KeysetPage, account_history_match, decode_transaction_cursor, parse_date_arg
+from lookups import account_name
+from statements import balance_on, monthly_statement
+from transfers import execute_transfer
+
+bp = Blueprint('customer', __name__)
+
+
+# Columns each view actually renders, so rows are shaped by the server
+DASHBOARD_CUSTOMER_PROJECTION = {'fname': 1, 'lname': 1, 'address': 1, 'ssn': 1, 'accountTypeId': 1}
+DASHBOARD_ACCOUNT_PROJECTION = {'accountNumber': 1, 'balance': 1, 'debitCard': 1, 'bankId': 1}
+HISTORY_PROJECTION = {'dateTime': 1, 'type': 1, 'amount': 1, 'accountId': 1, 'senderAccount': 1,
+                      'receiverAccount': 1}
+
+
+@bp.route('/dashboard')
+def dashboard():
+    if 'username' in session:
+        db = get_db()
+        username = session['username']
+        user = db['customers'].find_one({'username': username}, DASHBOARD_CUSTOMER_PROJECTION)
+
+        if user:
+            customer_id = user['_id']
+
+            # Fetch all accounts associated with the user
+            accounts = list(db['accounts'].find({'CustomerId': customer_id}, DASHBOARD_ACCOUNT_PROJECTION))
+
+            # Resolve every bank and the account type in one query each
+            bank_ids = list({account['bankId'] for account in accounts if account.get('bankId')})
+            banks = {bank['_id']: bank['name'] for bank in db['banks'].find({'_id': {'$in': bank_ids}}, {'name': 1})}
+            account_type = "Not Available"  # Default if not found
+            if 'accountTypeId' in user:
+                category = db['category'].find_one({'_id': user['accountTypeId']}, {'AccountType': 1})
+                account_type = category['AccountType'] if category else account_type
+            for account in accounts:
+                account['bankName'] = banks.get(account.get('bankId'), 'Unknown Bank')
+
+            # The page details and lists the history of the last account
+            account_details = None
+            transactions = []
+            statement = None
+            if accounts:
+                account = accounts[-1]
+                account_details = {
+                    'fname': user['fname'],
+                    'lname': user['lname'],
+                    'balance': account['balance'],
+                    'debitCardNumber': account['debitCard'],
+                    'accountNumber': account['accountNumber'],
+                    'address': user['address'],
+                    'ssn': user['ssn'],
+                    'accountType': account_type
+                }
+                # Month-to-date totals come from the statement snapshots, not the ledger
+                statement = monthly_statement(db, account['accountNumber'], datetime.now().strftime('%Y-%m'))
+
+                # "Load more" continues the history from a cursor. The page is read
+                # off the cursor while the template streams.
+                cursor = None
+                if request.args.get('account') == account['accountNumber']:
+                    cursor = decode_transaction_cursor(request.args.get('after', ''))
+                transactions = KeysetPage(db['transactions'].find(
+                    account_history_match(account['accountNumber'], cursor), HISTORY_PROJECTION
+                ).sort([('dateTime', -1), ('_id', -1)]).limit(DASHBOARD_PAGE_SIZE + 1), DASHBOARD_PAGE_SIZE)
+
+            return stream_template('dashboard.html', username=username, accounts=accounts,
+                                   account_details=account_details, transactions=transactions, statement=statement)
+
+        else:
+            return redirect(url_for('auth.login'))
+    else:
+        return redirect(url_for('auth.login'))
+
+
+@bp.route('/statement')
+def statement():
+    if 'username' in session:
+        db = get_db()
+        username = session['username']
+        user = db['customers'].find_one({'username': username}, {'_id': 1})
+        if not user:
+            return redirect(url_for('auth.login'))
+
+        # Only the customer's own accounts can be viewed
+        account_query = {'CustomerId': user['_id']}
+        if request.args.get('account'):
+            account_query['accountNumber'] = request.args.get('account')
+        account = db['accounts'].find_one(account_query, {'accountNumber': 1})
+        if not account:
+            return 'No account found for the user'
+
+        month = request.args.get('month', '')
+        try:
+            datetime.strptime(month, '%Y-%m')
+        except ValueError:
+            month = datetime.now().strftime('%Y-%m')
+        account_statement = monthly_statement(db, account['accountNumber'], month)
+
+        # Optional "balance on date X" lookup
+        balance_date = parse_date_arg(request.args.get('date', ''))
+        balance_on_date = None
+        if balance_date:
+            balance_on_date = balance_on(db, account['accountNumber'], balance_date.strftime('%Y-%m-%d'))
+
+        return render_template('statement.html', username=username, account_number=account['accountNumber'],
+                               statement=account_statement, balance_date=request.args.get('date', ''),
+                               balance_on_date=balance_on_date)
+    else:
+        return redirect(url_for('auth.login'))
+
+
+@bp.route('/transfer', methods=['GET', 'POST'])
+def transfer():
+    if 'username' in session:
+        db = get_db()
+        username = session['username']
+        # Fetch user details
+        user = db['customers'].find_one({'username': username})
+
+        if request.method == 'POST':
+            # Extract transfer details from form
+            sender_account_number = request.form.get('sender_account')
+            receiver_account_number = request.form.get('receiver_account')
+            # Client-generated key so a resubmitted form is applied only once
+            idempotency_key = request.form.get('idempotency_key') or secrets.token_hex(16)
+
+            # The amount is validated by execute_transfer
+            result = execute_transfer(get_client(), db, sender_account_number, receiver_account_number,
+                                      request.form.get('amount'), idempotency_key,
+                                      use_transaction=current_app.config['MONGO_TRANSACTIONS'], writer=ledger_writer())
+            if result == transfers.COMPLETED:
+                flash('Transfer completed successfully', 'success')
+            elif result == transfers.DUPLICATE:
+                flash('Transfer already processed', 'success')
+            elif result == transfers.INVALID_AMOUNT:
+                flash('Invalid amount', 'error')
+            elif result == transfers.RECEIVER_NOT_FOUND:
+                flash('Receiver account not found', 'error')
+            else:
+                flash('Insufficient funds', 'error')
+
+            return redirect(url_for('customer.transfer'))
+
+        if user:
+            # Assuming the customer ID is stored in the user's document
+            customer_id = user['_id']
+            # Fetch account details
+            account = db['accounts'].find_one({'CustomerId': customer_id})
+
+            if account:
+                user_account_number = account['accountNumber']
+                balance = round(account['balance'], 2)
+                return render_template('transfer.html', username=username, user_account_number=user_account_number, balance=balance,
+                                       idempotency_key=secrets.token_hex(16))
+            else:
+                return 'No account found for the user'
+        else:
+            return redirect(url_for('auth.login'))
+
+    # Render transfer form on GET request
+    return render_template('transfer.html', username=session['username'])
+
+
+@bp.route('/get_account_name', methods=['POST'])
+def get_account_name():
+    return {'name': account_name(request.form.get('account_number', ''))}
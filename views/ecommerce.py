@@ -0,0 +1,76 @@
+import concurrent.futures
+
+from flask import Blueprint, current_app, jsonify, render_template, request
+
+import payments
+from extensions import get_db, ledger_writer, payment_pool
+from instrumentation import bind_current_context
+from payments import PaymentError
+from transfers import card_payment, parse_amount
+
+bp = Blueprint('ecommerce', __name__)
+
+
+@bp.route('/ecommerce')
+def ecommerce():
+    return render_template('ecommerce/index.html')
+
+
+@bp.route('/payment')
+def payment():
+    price = request.args.get('price', '0.00')  # Default to 0.00 if not provided
+    return render_template('ecommerce/payment.html', price=price)
+
+
+@bp.route('/process_payment', methods=['POST'])
+def process_payment():
+    debit_card_number = request.form.get('debitCardNumber')
+    amount = parse_amount(request.form.get('amount'))
+
+    if amount is not None and card_payment(get_db(), debit_card_number, amount, writer=ledger_writer()) is not None:
+        return 'Payment successful'
+    else:
+        return 'Payment failed: Insufficient funds or invalid card number'
+
+
+def payment_response(func, *args, undo=None):
+    # The blocking driver call runs on the bounded payment pool so a slow database
+    # fails fast with a 504 instead of tying up the worker thread indefinitely.
+    # Pool threads have no app context, so the database handle is resolved here.
+    # undo(db, result) reverses a call that completes after the client was told it timed out.
+    db = get_db()
+    call = payment_pool().submit(bind_current_context(func), db, *args)
+    try:
+        return jsonify({'status': 'ok', **call.result(timeout=current_app.config['PAYMENT_API_TIMEOUT'])})
+    except PaymentError as error:
+        code, message = error.code, error.message
+    except concurrent.futures.TimeoutError:
+        # The call may still complete after the client has given up on it
+        if undo is not None:
+            call.add_done_callback(lambda done: done.exception() is None and undo(db, done.result()))
+        code, message = payments.TIMEOUT, 'The payment service did not respond in time'
+    return jsonify({'status': 'error', 'code': code, 'message': message}), payments.ERROR_STATUS[code]
+
+
+@bp.route('/api/payments/authorize', methods=['POST'])
+def api_authorize_payment():
+    data = request.get_json(silent=True) or {}
+    amount = parse_amount(data.get('amount'))
+    if amount is None:
+        return jsonify({'status': 'error', 'code': payments.INVALID_REQUEST, 'message': 'Invalid amount'}), 400
+    # Clients retrying after a timeout send the same key and get the same authorization.
+    # Without a key the client can never learn a late hold's id, so it is voided.
+    idempotency_key = request.headers.get('Idempotency-Key') or data.get('idempotencyKey')
+    undo = None if idempotency_key else lambda db, result: payments.void(db, result['authorizationId'])
+    return payment_response(payments.authorize, data.get('debitCardNumber'), round(amount, 2),
+                            data.get('merchant') or 'Online Ecommerce', idempotency_key, undo=undo)
+
+
+@bp.route('/api/payments/<authorization_id>/capture', methods=['POST'])
+def api_capture_payment(authorization_id):
+    return payment_response(payments.capture, authorization_id, ledger_writer())
+
+
+@bp.route('/api/payments/<authorization_id>/void', methods=['POST'])
+def api_void_payment(authorization_id):
+    return payment_response(payments.void, authorization_id)
@@ -0,0 +1,23 @@
+"""WSGI entry point for multi-process servers.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+gunicorn.conf.py sets the worker count, prepares the database once in the
+master (indexes, login credentials, dashboard counters; see
+main.prepare_database) and warms each worker after fork. Database settings
+come from the ADB_* environment variables read by config.py. Other servers
+must run the same preparation before serving, e.g.
+
+    flask --app main ensure-indexes
+    flask --app main sync-credentials
+    flask --app main reconcile-counters
+
+Each worker keeps its own /metrics histograms; gunicorn.conf.py points
+ADB_METRICS_DIR at a shared directory so any worker's /metrics reports the
+sum over all of them. Other multi-process servers should set it too (and
+empty it on restart), or every scrape only sees the worker that answered.
+"""
+from main import create_app
+
+# Web workers don't need the CLI commands or the modules behind them
+app = create_app({'CLI_COMMANDS': False})